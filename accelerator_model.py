@@ -0,0 +1,155 @@
+import os
+import json
+import sqlite3
+import argparse
+from collections import Counter
+from create_l10n_db import database_path
+from locale_packs import FALLBACK_LANGUAGE, load_pack
+from accelerators import DEFAULT_WEIGHT, DEFAULT_MODEL_PATH, POSITION_BUCKETS, word_position, count_unescaped_ampersands
+
+# Builds the accelerator weights from the approved translations of the l10n
+# database. Letters that translators often use as accelerators get low
+# weights, as new accelerators on them are the most likely to clash with the
+# ones already in a dialog, the way the letter frequencies of the locale pack
+# do for the general frequencies of the language. The model is for the
+# language of the database and replaces the weights of that language only.
+# Positions in the word are weighted by how often translators pick a letter
+# at that position when they could, so a model follows the usual placement
+# (say, the first letter of a word).
+#
+# Counts are kept per file in a state file next to the model, with the file's
+# hash from the database's files table, so a rebuild after an import only
+# reads the translations of the files that changed.
+
+# Accelerator shares (%) below this all get the largest weight
+MIN_PENALTY = 0.1
+
+# Position weights below this are raised to it, so no position is ruled out
+MIN_POSITION_WEIGHT = 0.001
+
+# Bump when the counts kept in the state file change
+STATE_VERSION = 1
+
+def empty_counts():
+  return {'letters': Counter(), 'chosen': [0] * POSITION_BUCKETS, 'available': [0] * POSITION_BUCKETS}
+
+def count_msgstr(msgstr, counts, excluded_letters):
+  """Add the accelerators of msgstr to `counts`, with the positions that were available."""
+  if count_unescaped_ampersands(msgstr) < 1:
+    return
+  chosen_indexes = set()
+  plain = []
+  i = 0
+  while i < len(msgstr):
+    if msgstr.startswith('&&', i):
+      plain.append('&&')
+      i += 2
+      continue
+    if msgstr[i] == '&':
+      if i + 1 < len(msgstr) and msgstr[i + 1] != '&':
+        chosen_indexes.add(sum(map(len, plain)))
+      i += 1
+      continue
+    plain.append(msgstr[i])
+    i += 1
+  text = ''.join(plain)
+  for index, ch in enumerate(text):
+    if not ch.isalpha() or ch.lower() in excluded_letters:
+      continue
+    bucket = min(word_position(text, index), POSITION_BUCKETS - 1)
+    counts['available'][bucket] += 1
+    if index in chosen_indexes:
+      counts['letters'][ch.lower()] += 1
+      counts['chosen'][bucket] += 1
+
+def count_file(conn, project, filename, excluded_letters):
+  """Count the accelerators of the approved entries of one imported file."""
+  counts = empty_counts()
+  cursor = conn.execute('''
+  SELECT msgstr FROM translations
+  WHERE project = ? AND filename = ? AND approved AND NOT obsolete AND msgstr LIKE '%&%'
+  ''', (project, filename))
+  for (msgstr,) in cursor:
+    count_msgstr(msgstr, counts, excluded_letters)
+  return counts
+
+def model_weights(totals, pack):
+  """Turn the corpus counts into the weights read by AcceleratorWeights.load()."""
+  total = sum(totals['letters'].values())
+  # Letters of the language never used as accelerators are the least likely to clash
+  letters = {letter: int(100 / max(100 * totals['letters'][letter] / total if total else 0, MIN_PENALTY))
+             for letter in sorted(set(pack.letter_weights) | set(totals['letters']))}
+  rates = [chosen / available if available else 0.0
+           for chosen, available in zip(totals['chosen'], totals['available'])]
+  best = max(rates)
+  positions = [max(round(rate / best, 3), MIN_POSITION_WEIGHT) if best else 1 for rate in rates]
+  return {'language': pack.language, 'letters': letters, 'default': DEFAULT_WEIGHT, 'positions': positions,
+          'accelerators': total}
+
+def load_state(path, language):
+  try:
+    with open(path, encoding='utf-8') as f:
+      state = json.load(f)
+    if state.get('version') == STATE_VERSION and state.get('language') == language:
+      return state['files']
+  except (OSError, ValueError):
+    pass
+  return {}
+
+def build_model(db_path, model_path, language=FALLBACK_LANGUAGE, state_path=None):
+  """
+  Write the model of the database's approved translations, in `language`, to `model_path`,
+  reading only the files that changed since the last build. Returns the number of files read.
+  """
+  if state_path is None:
+    state_path = f"{model_path}.state"
+  pack = load_pack(language)
+  previous = load_state(state_path, pack.language)
+  files = {}
+  read = 0
+  conn = sqlite3.connect(db_path)
+  try:
+    for project, filename, digest in conn.execute("SELECT project, filename, hash FROM files").fetchall():
+      key = f"{project}/{filename}"
+      record = previous.get(key)
+      if record is None or record['hash'] != digest:
+        counts = count_file(conn, project, filename, pack.excluded_letters)
+        record = {'hash': digest, 'letters': dict(counts['letters']),
+                  'chosen': counts['chosen'], 'available': counts['available']}
+        read += 1
+      files[key] = record
+  finally:
+    conn.close()
+
+  totals = empty_counts()
+  for record in files.values():
+    totals['letters'].update(record['letters'])
+    for name in ('chosen', 'available'):
+      totals[name] = [a + b for a, b in zip(totals[name], record[name])]
+  for path, data in ((state_path, {'version': STATE_VERSION, 'language': pack.language, 'files': files}),
+                     (model_path, model_weights(totals, pack))):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+      json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+  return read
+
+def main():
+  parser = argparse.ArgumentParser(description="Build the accelerator weights from the l10n database.")
+  parser.add_argument('--db', default=database_path, help="The l10n database to read.")
+  parser.add_argument('--output', default=DEFAULT_MODEL_PATH, help="The model file to write.")
+  parser.add_argument('--language', default=FALLBACK_LANGUAGE,
+                      help=f"The language of the database's translations (default: {FALLBACK_LANGUAGE}).")
+  args = parser.parse_args()
+
+  read = build_model(args.db, args.output, args.language)
+  with open(args.output, encoding='utf-8') as f:
+    model = json.load(f)
+  print(f"Read {read} changed files, {model['accelerators']} accelerators in the model.")
+  print("Letter weights: " + '  '.join(f"{letter} {weight}" for letter, weight in
+                                       sorted(model['letters'].items(), key=lambda item: item[1])))
+  print("Position weights (first, second, later letter of a word): " +
+        ', '.join(str(weight) for weight in model['positions']))
+
+if __name__ == "__main__":
+  main()
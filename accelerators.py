@@ -0,0 +1,134 @@
+import json
+import random
+from bisect import bisect
+from itertools import accumulate
+
+# Keyboard accelerators (the letter after an unescaped &) shared by the
+# repair tool and the keybinding fixer. New accelerators go to letters drawn
+# at random, weighted against the common letters of the catalog's language
+# (see locale_packs.py), preferring letters that sibling entries (same
+# msgctxt) do not use yet. The weights can be replaced by a model built from
+# the approved translations of the l10n database (see accelerator_model.py),
+# which also weighs the position of the letter in its word.
+
+# Weight of the letters without a frequency
+DEFAULT_WEIGHT = 100
+
+# The model file written by accelerator_model.py
+DEFAULT_MODEL_PATH = 'accelerator_model.json'
+
+# Positions of a letter in its word told apart by the weights: first, second, any later one
+POSITION_BUCKETS = 3
+
+class AcceleratorWeights:
+  """Weights of the letters that can take an accelerator, by letter and by position in the word."""
+
+  def __init__(self, letters, default=DEFAULT_WEIGHT, positions=(1,) * POSITION_BUCKETS, language=None):
+    self.language = language
+    self.letters = letters
+    self.default = default
+    self.positions = list(positions)
+
+  def weight(self, letter, position):
+    return self.letters.get(letter, self.default) * self.positions[min(position, POSITION_BUCKETS - 1)]
+
+  @classmethod
+  def load(cls, path):
+    """Load the weights written by accelerator_model.py, language is None in models that predate it."""
+    with open(path, encoding='utf-8') as f:
+      model = json.load(f)
+    return cls(model['letters'], model['default'], model['positions'], model.get('language'))
+
+def count_unescaped_ampersands(s):
+  """Count the ampersands of s that are not escaped as &&."""
+  return s.count('&') - s.count('&&') * 2
+
+def accelerator_letters(msgstr, lower=str.lower):
+  """Return the set of letters marked as accelerators in msgstr, lowercased with `lower`."""
+  letters = set()
+  cleaned = msgstr.replace('&&', '')
+  position = cleaned.find('&')
+  while position != -1 and position + 1 < len(cleaned):
+    letters.add(lower(cleaned[position + 1]))
+    position = cleaned.find('&', position + 1)
+  return letters
+
+def remove_unescaped_ampersand(msgstr, count_to_remove):
+  """
+  Remove only unescaped ampersands (&) from the string, leaving escaped ampersands (&&) intact.
+  `count_to_remove` specifies how many ampersands to remove.
+  """
+  result = []
+  i = 0
+  ampersands_removed = 0
+  while i < len(msgstr):
+    # Check for escaped ampersands (&&)
+    if msgstr[i:i+2] == '&&':
+      result.append('&&')
+      i += 2  # Skip both '&'
+    elif msgstr[i] == '&' and ampersands_removed < count_to_remove:
+      # Remove the unescaped ampersand
+      ampersands_removed += 1
+      i += 1  # Skip this '&'
+    else:
+      result.append(msgstr[i])
+      i += 1
+  return ''.join(result)
+
+def candidate_positions(msgstr, locale):
+  """
+  Return {letter: position} of the first occurrence (in either case, by the case mappings of the
+  `locale` pack) of every letter of msgstr that can take an accelerator: not excluded by the
+  locale and not already marked. Letters are sorted, so
+  that seeded random choices do not depend on set ordering.
+  """
+  marked = accelerator_letters(msgstr, locale.lower) if '&' in msgstr else ()
+  lowered = locale.lower(msgstr)
+  if len(lowered) != len(msgstr):
+    # Some letters lowercase to two characters, keep the positions aligned
+    lowered = ''.join(locale.lower(ch)[0] for ch in msgstr)
+  return {letter: lowered.find(letter) for letter in sorted(set(lowered))
+          if letter.isalpha() and letter not in locale.excluded_letters and letter not in marked}
+
+def word_position(s, index):
+  """Return how many letters precede the one at `index` in its word."""
+  start = index
+  while start > 0 and s[start - 1].isalpha():
+    start -= 1
+  return index - start
+
+def assign_ampersand_randomly(msgstr, ampersands_to_add, locale, avoid=(), rng=random):
+  """
+  Assign ampersands randomly to letters in msgstr.
+  Penalize the common letters of the `locale` pack, exclude its excluded letters and, as long as
+  other letters are left, the letters in `avoid` (used by sibling entries). Each letter is used once.
+  """
+  positions = candidate_positions(msgstr, locale)
+  letters = [letter for letter in positions if letter not in avoid] or list(positions)
+  weights = [locale.weights.weight(letter, word_position(msgstr, positions[letter])) for letter in letters]
+  chosen = []
+  for _ in range(min(ampersands_to_add, len(letters))):
+    cumulative = list(accumulate(weights))
+    if cumulative[-1] > 0:
+      index = bisect(cumulative, rng.random() * cumulative[-1])
+    else:
+      # A model may weigh every candidate at 0, pick one uniformly then
+      index = rng.choice(range(len(letters)))
+    chosen.append(positions[letters.pop(index)])
+    weights.pop(index)
+  # Insert from the end so the earlier positions stay valid
+  for position in sorted(chosen, reverse=True):
+    msgstr = msgstr[:position] + '&' + msgstr[position:]
+  return msgstr
+
+def file_seed(seed, filepath):
+  """The seed for one file, so that its result does not depend on the order files are processed in."""
+  return f"{seed}:{filepath}"
+
+def sibling_accelerators(entries, lower=str.lower):
+  """Map each msgctxt to the accelerator letters its entries' msgstrs use, lowercased with `lower`."""
+  used = {}
+  for entry in entries:
+    if entry.msgctxt is not None and '&' in entry.msgstr:
+      used.setdefault(entry.msgctxt, set()).update(accelerator_letters(entry.msgstr, lower))
+  return used
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+from po_reader import iter_po_entries
+from po_corpus import generate_corpus
+
+# Times the pipelines of the tools on a tree of .po files (a synthetic one
+# from po_corpus.py by default) and saves the results as a JSON baseline
+# that later runs can be compared against. Every run works on a fresh copy
+# of the tree in its own process, so that files changed by one run do not
+# affect the next and the peak RSS is that of the pipeline alone.
+
+def run_repair(directory):
+  import fuzzy_repair_tool
+  fuzzy_repair_tool.scan_directory(directory)
+
+def run_keybindings(directory):
+  import fix_keybindings
+  fix_keybindings.scan_directory(directory)
+
+def run_db_import(directory):
+  import create_l10n_db
+  conn = sqlite3.connect(os.path.join(directory, 'benchmark.db'))
+  try:
+    create_l10n_db.create_database(conn)
+    create_l10n_db.parse_po_files(directory, conn)
+    create_l10n_db.create_indexes(conn)
+  finally:
+    conn.close()
+
+def run_editor_filter(directory):
+  import queue
+  import threading
+  import fuzzy_editor
+  # The editor's prefetch of the parsed files and their selected entries, without the editing
+  for comparison_type in ('whitespace_punctuation', 'character_difference'):
+    files = queue.Queue(maxsize=fuzzy_editor.PREFETCH_FILES)
+    prefetcher = threading.Thread(target=fuzzy_editor.prefetch_po_files,
+                                  args=(directory, comparison_type, 2, False, files, threading.Event()))
+    prefetcher.start()
+    while files.get() is not None:
+      pass
+    prefetcher.join()
+
+PIPELINES = {
+  'repair': run_repair,
+  'keybindings': run_keybindings,
+  'db_import': run_db_import,
+  'editor_filter': run_editor_filter
+}
+
+def timed_run(name, directory, seed):
+  """Run a pipeline in this (fresh) process and return (seconds, peak RSS in KiB)."""
+  random.seed(seed)
+  with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+    start = time.perf_counter()
+    PIPELINES[name](directory)
+    elapsed = time.perf_counter() - start
+  return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def count_corpus(directory):
+  """Return the number of .po files and entries under directory."""
+  files = 0
+  entries = 0
+  for root, _, names in os.walk(directory):
+    for name in names:
+      if name.endswith('.po'):
+        files += 1
+        entries += sum(1 for _ in iter_po_entries(os.path.join(root, name)))
+  return files, entries
+
+def benchmark(name, corpus, repeat, seed):
+  """Run a pipeline `repeat` times on copies of the corpus, keeping the best time."""
+  times = []
+  peak_rss = 0
+  context = multiprocessing.get_context('spawn')
+  for _ in range(repeat):
+    with tempfile.TemporaryDirectory() as scratch:
+      directory = os.path.join(scratch, 'messages')
+      shutil.copytree(corpus, directory)
+      with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        elapsed, rss = executor.submit(timed_run, name, directory, seed).result()
+    times.append(elapsed)
+    peak_rss = max(peak_rss, rss)
+  return min(times), peak_rss
+
+def current_commit():
+  """Return the commit of the working tree, or None outside a git checkout."""
+  try:
+    return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                          check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+def print_comparison(results, baseline):
+  """Print the change of each pipeline's time and memory against a baseline."""
+  print(f"\nCompared to {baseline.get('commit') or 'the baseline'}:")
+  if baseline.get('corpus') != results['corpus']:
+    print("  (the baseline was measured on a different corpus)")
+  for name, result in results['pipelines'].items():
+    old = baseline['pipelines'].get(name)
+    if old is None:
+      continue
+    speedup = old['seconds'] / result['seconds']
+    memory = result['peak_rss_mb'] - old['peak_rss_mb']
+    print(f"  {name:<14} {speedup:5.2f}x speed, {memory:+7.1f} MB peak RSS")
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="Benchmark the tools on a tree of .po files.")
+  parser.add_argument('--corpus', help="The tree to use instead of generating one.")
+  parser.add_argument('--projects', type=int, default=8, help="Projects in the generated corpus.")
+  parser.add_argument('--files', type=int, default=10, help="Files per project in the generated corpus.")
+  parser.add_argument('--entries', type=int, default=200, help="Average entries per file in the generated corpus.")
+  parser.add_argument('--seed', type=int, default=0, help="Seed of the generated corpus and of the tools.")
+  parser.add_argument('--pipelines', nargs='+', choices=list(PIPELINES), default=list(PIPELINES),
+                      help="The pipelines to run (default: all).")
+  parser.add_argument('--repeat', type=int, default=3, help="Runs per pipeline, the best one is kept.")
+  parser.add_argument('--output', help="Save the results to this JSON file.")
+  parser.add_argument('--baseline', help="Compare the results with this JSON file.")
+  return parser.parse_args()
+
+def main():
+  args = parse_args()
+  with tempfile.TemporaryDirectory() as scratch:
+    corpus = args.corpus
+    if corpus is None:
+      corpus = os.path.join(scratch, 'messages')
+      generate_corpus(corpus, args.projects, args.files, args.entries, args.seed)
+      description = {'projects': args.projects, 'files': args.files, 'entries': args.entries, 'seed': args.seed}
+    else:
+      description = {'path': os.path.abspath(corpus)}
+    files, entries = count_corpus(corpus)
+    description.update({'total_files': files, 'total_entries': entries})
+    print(f"Corpus: {files} files, {entries} entries")
+
+    results = {
+      'commit': current_commit(),
+      'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+      'python': platform.python_version(),
+      'corpus': description,
+      'pipelines': {}
+    }
+    for name in args.pipelines:
+      seconds, peak_rss = benchmark(name, corpus, args.repeat, args.seed)
+      results['pipelines'][name] = {
+        'seconds': round(seconds, 4),
+        'files_per_sec': round(files / seconds, 1),
+        'entries_per_sec': round(entries / seconds, 1),
+        'peak_rss_mb': round(peak_rss / 1024, 1)
+      }
+      print(f"{name:<14} {seconds:8.3f} s  {files / seconds:9.1f} files/s  "
+            f"{entries / seconds:10.1f} entries/s  {peak_rss / 1024:7.1f} MB")
+
+  if args.output:
+    with open(args.output, 'w', encoding='utf-8') as f:
+      json.dump(results, f, indent=2)
+    print(f"Saved the results to {args.output}.")
+  if args.baseline:
+    with open(args.baseline, encoding='utf-8') as f:
+      print_comparison(results, json.load(f))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,110 @@
+import os
+import string
+import argparse
+from enum import Enum
+from collections import Counter
+from functools import lru_cache
+from po_reader import iter_po_entries
+from edit_distance import bounded_edit_distance
+
+# Classification of msgid changes (previous msgid -> msgid), shared by the
+# repair tool and the editor as a first stage before looking at the entry.
+# Normalization deletes punctuation with precompiled str.translate tables and
+# collapses whitespace, and is memoized, as the same msgids come back in many
+# catalogs. Two punctuation sets are used: the one the repair rules know how to
+# carry over to msgstr, and all of string.punctuation for the editor's filter.
+
+# Punctuation that the repair rules follow in msgstr (accelerators, trailing '...', ':', '.', ',')
+REPAIRABLE_PUNCTUATION = '.&:,…'
+ALL_PUNCTUATION = string.punctuation + '…'
+
+# str.lower() turns a final 'Σ' into 'ς', map it beforehand so case is folded one letter at a time
+CASE_TABLE = str.maketrans('Σ', 'σ')
+REPAIRABLE_TABLE = str.maketrans('Σ', 'σ', REPAIRABLE_PUNCTUATION)
+PUNCTUATION_TABLE = str.maketrans('Σ', 'σ', ALL_PUNCTUATION)
+AMPERSAND_TABLE = str.maketrans('', '', '&')
+
+# Memoized normalizations kept per table
+NORMALIZE_CACHE_SIZE = 1 << 16
+
+class ChangeKind(Enum):
+  IDENTICAL = 1     # The msgid did not change (only a context or plural change)
+  ACCELERATOR = 2   # Only ampersands were added, removed or moved
+  CASE = 3          # Only the case changed
+  TRIVIAL = 4       # Only case, whitespace and the punctuation of REPAIRABLE_PUNCTUATION changed
+  PUNCTUATION = 5   # Only case, whitespace and any punctuation changed
+  SMALL_EDIT = 6    # Within max_char_diff edits
+  REWRITE = 7       # Anything else, or no previous msgid
+
+# The changes the repair rules can carry over to msgstr
+REPAIRABLE_KINDS = {ChangeKind.IDENTICAL, ChangeKind.ACCELERATOR, ChangeKind.CASE, ChangeKind.TRIVIAL}
+# The changes the editor's whitespace_punctuation filter lets through
+PUNCTUATION_KINDS = REPAIRABLE_KINDS | {ChangeKind.PUNCTUATION}
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_repairable(s):
+  """Lowercase s, removing the punctuation of REPAIRABLE_PUNCTUATION and normalizing whitespace."""
+  return ' '.join(s.translate(REPAIRABLE_TABLE).split()).lower()
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_punctuation(s):
+  """Lowercase s, removing all punctuation and normalizing whitespace."""
+  return ' '.join(s.translate(PUNCTUATION_TABLE).split()).lower()
+
+def classify_change(old, new, max_char_diff=2):
+  """Return the ChangeKind of the change from the `old` msgid to the `new` one."""
+  if old is None or new is None:
+    return ChangeKind.REWRITE
+  if old == new:
+    return ChangeKind.IDENTICAL
+  if ('&' in old or '&' in new) and old.translate(AMPERSAND_TABLE) == new.translate(AMPERSAND_TABLE):
+    return ChangeKind.ACCELERATOR
+  if old.translate(CASE_TABLE).lower() == new.translate(CASE_TABLE).lower():
+    return ChangeKind.CASE
+  if normalize_repairable(old) == normalize_repairable(new):
+    return ChangeKind.TRIVIAL
+  if normalize_punctuation(old) == normalize_punctuation(new):
+    return ChangeKind.PUNCTUATION
+  if bounded_edit_distance(old, new, max_char_diff) <= max_char_diff:
+    return ChangeKind.SMALL_EDIT
+  return ChangeKind.REWRITE
+
+def classify_changes(pairs, max_char_diff=2):
+  """Classify a batch of (old, new) msgid pairs, each distinct pair once."""
+  kinds = {}
+  result = []
+  for pair in pairs:
+    kind = kinds.get(pair)
+    if kind is None:
+      kind = kinds[pair] = classify_change(pair[0], pair[1], max_char_diff)
+    result.append(kind)
+  return result
+
+def is_repairable(old, new):
+  """Check if two strings differ only by case, whitespace and the punctuation the repair rules follow."""
+  return classify_change(old, new) in REPAIRABLE_KINDS
+
+def differs_by_punctuation(old, new):
+  """Check if two strings differ only by case, whitespace and punctuation."""
+  return classify_change(old, new) in PUNCTUATION_KINDS
+
+def main():
+  parser = argparse.ArgumentParser(description="Count the kinds of msgid changes of the fuzzy entries.")
+  parser.add_argument('directory', help="The directory to scan for .po files.")
+  parser.add_argument('--max-char-diff', type=int, default=2,
+                      help="The largest edit counted as a small edit (default: 2).")
+  args = parser.parse_args()
+
+  pairs = []
+  for root, _, files in os.walk(args.directory):
+    for name in files:
+      if name.endswith('.po'):
+        pairs.extend((entry.previous_msgid, entry.msgid)
+                     for entry in iter_po_entries(os.path.join(root, name)) if 'fuzzy' in entry.flags)
+  counts = Counter(classify_changes(pairs, args.max_char_diff))
+  for kind in ChangeKind:
+    print(f"{kind.name.lower():12} {counts[kind]:8}")
+  print(f"{'total':12} {len(pairs):8}")
+
+if __name__ == "__main__":
+  main()
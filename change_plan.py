@@ -0,0 +1,141 @@
+import json
+import polib
+from itertools import groupby
+from po_writer import save_changed_entries
+
+# Change plans: the changes a tool would make, one JSON record per line,
+# written by a --dry-run pass instead of saving the files. A reviewed plan
+# is applied later with --apply, which only looks the entries up and writes
+# them, without running the detection again. Entries whose translation no
+# longer matches the one seen by the dry run are reported as stale and left
+# alone.
+
+def plural_list(msgstr_plural):
+  """Return msgstr_plural as a list ordered by plural index, None when empty."""
+  if not msgstr_plural:
+    return None
+  return [msgstr_plural[index] for index in sorted(msgstr_plural)]
+
+def change_record(tool, rules, filepath, entry, old_msgstr, old_msgstr_plural, mark_translated=False):
+  """
+  Return the plan record of a change to `entry`, given its translation before the change.
+  `rules` names the transforms that fired, `mark_translated` that the fuzzy flag was removed.
+  """
+  return {
+    'tool': tool,
+    'rules': rules,
+    'file': filepath,
+    'linenum': entry.linenum,
+    'msgctxt': entry.msgctxt,
+    'msgid': entry.msgid,
+    'msgid_plural': entry.msgid_plural or None,
+    'old_msgstr': old_msgstr,
+    'new_msgstr': entry.msgstr,
+    'old_msgstr_plural': plural_list(old_msgstr_plural),
+    'new_msgstr_plural': plural_list(entry.msgstr_plural),
+    'mark_translated': mark_translated
+  }
+
+class PlanWriter:
+  """Streams change records to a JSON Lines file."""
+
+  def __init__(self, path):
+    self.path = path
+    self.file = open(path, 'w', encoding='utf-8')
+    self.count = 0
+
+  def write(self, records):
+    for record in records:
+      self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+      self.count += 1
+
+  def close(self):
+    self.file.close()
+
+def read_plan(path):
+  """Yield the records of a plan file."""
+  with open(path, encoding='utf-8') as f:
+    for line in f:
+      if line.strip():
+        yield json.loads(line)
+
+def entry_index(po):
+  """
+  Index the entries of `po` that are not obsolete by line number and by (msgctxt, msgid), the
+  latter to a list of the entries with that key in file order.
+  """
+  lines = {}
+  keys = {}
+  for entry in po:
+    if not entry.obsolete:
+      lines[entry.linenum] = entry
+      keys.setdefault((entry.msgctxt, entry.msgid), []).append(entry)
+  return lines, keys
+
+def is_unchanged(entry, record):
+  """Check if `entry` still has the translation (and fuzzy flag) the record was made from."""
+  if entry.msgid_plural != (record['msgid_plural'] or ''):
+    return False
+  if entry.msgstr != record['old_msgstr'] or plural_list(entry.msgstr_plural) != record['old_msgstr_plural']:
+    return False
+  return entry.fuzzy or not record['mark_translated']
+
+def find_entry(index, record):
+  """
+  Return the entry of a record from the `index` of entry_index(): the one at the record's line if
+  it has the same msgctxt and msgid, else (the file changed since the dry run) the first entry
+  with that key that is unchanged, or None.
+  """
+  lines, keys = index
+  key = (record['msgctxt'], record['msgid'])
+  entry = lines.get(record['linenum'])
+  if entry is not None and (entry.msgctxt, entry.msgid) == key:
+    return entry
+  return next((entry for entry in keys.get(key, ()) if is_unchanged(entry, record)), None)
+
+def apply_record(index, record):
+  """
+  Apply a record to its entry in the `index` of entry_index(), returning the entry or None if the
+  plan is stale.
+  """
+  entry = find_entry(index, record)
+  if entry is None or not is_unchanged(entry, record):
+    return None
+  entry.msgstr = record['new_msgstr']
+  if record['new_msgstr_plural'] is not None:
+    entry.msgstr_plural = dict(enumerate(record['new_msgstr_plural']))
+  if record['mark_translated']:
+    entry.previous_msgctxt = None
+    entry.previous_msgid = None
+    entry.previous_msgid_plural = None
+    entry.flags.remove('fuzzy')
+  return entry
+
+def apply_plan(path):
+  """
+  Apply the changes of a plan file, one file at a time. Returns the number of applied and of
+  stale records.
+  """
+  applied = 0
+  stale = 0
+  records = sorted(read_plan(path), key=lambda record: record['file'])
+  for filepath, file_records in groupby(records, key=lambda record: record['file']):
+    file_records = list(file_records)
+    try:
+      po = polib.pofile(filepath, encoding='utf-8', wrapwidth=80)
+    except IOError as e:
+      print(f"Cannot read {filepath}: {e}")
+      stale += len(file_records)
+      continue
+    index = entry_index(po)
+    changed_entries = []
+    for record in file_records:
+      entry = apply_record(index, record)
+      if entry is None:
+        print(f"Stale change in {filepath}:{record['linenum']}, skipped.")
+        stale += 1
+      else:
+        changed_entries.append(entry)
+    save_changed_entries(po, changed_entries)
+    applied += len(changed_entries)
+  return applied, stale
@@ -0,0 +1,302 @@
+import os
+import re
+import sys
+import json
+import mmap
+import shutil
+import sqlite3
+import argparse
+from array import array
+from collections import Counter
+from create_l10n_db import database_path
+
+# Columnar export of the translations table for corpus-wide statistics. Rows
+# are sorted by project and file and every column is a file of its own in a
+# directory next to the database:
+#
+#   project.codes, filename.codes   dictionary codes (uint32), the values are in meta.json
+#   linenum.ints                    uint32
+#   approved.bits, fuzzy.bits, ...  bit-packed flags, bit i of byte i // 8 is row i
+#   msgid.offsets, msgid.data       uint64 start offsets (one more than the rows) and the
+#                                   UTF-8 text of all rows back to back, with a .nulls bitmap
+#                                   for the rows that are NULL
+#
+# The loader memory-maps the files, so aggregations run over whole buffers
+# (bit counts of row ranges, regexes over a text column) instead of a Python
+# loop over SQLite rows. The export is redone when the database changes.
+
+# Bump when the layout changes
+COLUMNS_VERSION = 1
+
+FLAG_COLUMNS = ['approved', 'fuzzy', 'obsolete']
+STRING_COLUMNS = ['msgid', 'msgstr', 'msgctxt', 'previous_msgid']
+
+# An accelerator: an unescaped '&' and the (UTF-8) character after it
+ACCELERATOR = re.compile(rb'&&|&([\x00-\x7f]|[\xc0-\xff][\x80-\xbf]+)')
+
+def columns_path_for(db_path):
+  return f"{db_path}.columns"
+
+def database_signature(db_path):
+  stat = os.stat(db_path)
+  return [COLUMNS_VERSION, stat.st_mtime_ns, stat.st_size]
+
+class BitWriter:
+  """Packs one bit per row."""
+
+  def __init__(self):
+    self.bytes = bytearray()
+    self.rows = 0
+
+  def append(self, value):
+    if self.rows % 8 == 0:
+      self.bytes.append(0)
+    if value:
+      self.bytes[-1] |= 1 << (self.rows % 8)
+    self.rows += 1
+
+class StringWriter:
+  """Streams a text column to its .data file, keeping the offsets and NULL bitmap."""
+
+  def __init__(self, directory, name):
+    self.file = open(os.path.join(directory, f"{name}.data"), 'wb')
+    self.offsets = array('Q', [0])
+    self.nulls = BitWriter()
+    self.position = 0
+
+  def append(self, text):
+    self.nulls.append(text is None)
+    if text:
+      data = text.encode('utf-8')
+      self.file.write(data)
+      self.position += len(data)
+    self.offsets.append(self.position)
+
+def export_columns(db_path, directory):
+  """Write the translations table of the database to `directory` in the columnar layout."""
+  tmp_directory = f"{directory}.tmp"
+  shutil.rmtree(tmp_directory, ignore_errors=True)
+  os.makedirs(tmp_directory)
+  dictionaries = {'project': {}, 'filename': {}}
+  codes = {name: array('I') for name in dictionaries}
+  linenums = array('I')
+  flags = {name: BitWriter() for name in FLAG_COLUMNS}
+  strings = {name: StringWriter(tmp_directory, name) for name in STRING_COLUMNS}
+  project_ranges = {}
+  conn = sqlite3.connect(db_path)
+  try:
+    cursor = conn.execute(f'''
+    SELECT project, filename, linenum, {', '.join(FLAG_COLUMNS)}, {', '.join(STRING_COLUMNS)}
+    FROM translations ORDER BY project, filename, linenum
+    ''')
+    for row_number, row in enumerate(cursor):
+      project, filename, linenum = row[:3]
+      for name, value in (('project', project), ('filename', filename)):
+        codes[name].append(dictionaries[name].setdefault(value, len(dictionaries[name])))
+      start, _ = project_ranges.get(project, (row_number, None))
+      project_ranges[project] = (start, row_number + 1)
+      linenums.append(linenum or 0)
+      for name, value in zip(FLAG_COLUMNS, row[3:6]):
+        flags[name].append(value)
+      for name, value in zip(STRING_COLUMNS, row[6:]):
+        strings[name].append(value)
+  finally:
+    conn.close()
+
+  def write(name, data):
+    with open(os.path.join(tmp_directory, name), 'wb') as f:
+      f.write(data)
+
+  for name in dictionaries:
+    write(f"{name}.codes", codes[name].tobytes())
+  write("linenum.ints", linenums.tobytes())
+  for name, bits in flags.items():
+    write(f"{name}.bits", bits.bytes)
+  for name, writer in strings.items():
+    writer.file.close()
+    write(f"{name}.offsets", writer.offsets.tobytes())
+    write(f"{name}.nulls", writer.nulls.bytes)
+  meta = {
+    'signature': database_signature(db_path),
+    'byteorder': sys.byteorder,
+    'rows': len(linenums),
+    'dictionaries': {name: list(values) for name, values in dictionaries.items()},
+    'project_ranges': project_ranges
+  }
+  write("meta.json", json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+  shutil.rmtree(directory, ignore_errors=True)
+  os.replace(tmp_directory, directory)
+
+def map_file(path):
+  """Memory-map a file read-only, empty files give an empty buffer."""
+  with open(path, 'rb') as f:
+    if os.fstat(f.fileno()).st_size == 0:
+      return b''
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+class Bitmap:
+  """A memory-mapped bit-packed flag column."""
+
+  def __init__(self, buffer, rows):
+    self.buffer = buffer
+    self.rows = rows
+
+  def __getitem__(self, row):
+    return bool(self.buffer[row >> 3] >> (row & 7) & 1)
+
+  def count(self, start=0, end=None):
+    """Count the rows in [start, end) that have the flag."""
+    end = self.rows if end is None else end
+    if start >= end:
+      return 0
+    value = int.from_bytes(self.buffer[start >> 3:(end + 7) >> 3], 'little')
+    value >>= start & 7
+    return (value & ((1 << (end - start)) - 1)).bit_count()
+
+  def runs(self, start=0, end=None):
+    """Yield the [run_start, run_end) ranges of consecutive rows in [start, end) that have the flag."""
+    end = self.rows if end is None else end
+    run_start = None
+    row = start
+    while row < end:
+      # Whole bytes of rows with or without the flag are taken at once
+      if row & 7 == 0 and row + 8 <= end and self.buffer[row >> 3] in (0, 0xff):
+        flagged = self.buffer[row >> 3] == 0xff
+        step = 8
+      else:
+        flagged = self[row]
+        step = 1
+      if flagged and run_start is None:
+        run_start = row
+      elif not flagged and run_start is not None:
+        yield run_start, row
+        run_start = None
+      row += step
+    if run_start is not None:
+      yield run_start, end
+
+class Strings:
+  """A memory-mapped text column."""
+
+  def __init__(self, directory, name, rows):
+    self.data = map_file(os.path.join(directory, f"{name}.data"))
+    self.offsets = memoryview(map_file(os.path.join(directory, f"{name}.offsets"))).cast('Q')
+    self.nulls = Bitmap(map_file(os.path.join(directory, f"{name}.nulls")), rows)
+
+  def __len__(self):
+    return len(self.offsets) - 1
+
+  def __getitem__(self, row):
+    if self.nulls[row]:
+      return None
+    return self.data[self.offsets[row]:self.offsets[row + 1]].decode('utf-8')
+
+  def buffer(self, start=0, end=None):
+    """The UTF-8 text of the rows in [start, end), back to back."""
+    end = len(self) if end is None else end
+    return self.data[self.offsets[start]:self.offsets[end]]
+
+class ColumnarCorpus:
+  """The columnar export of a database, loaded with memory maps."""
+
+  def __init__(self, directory):
+    with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+      self.meta = json.load(f)
+    if self.meta['byteorder'] != sys.byteorder:
+      raise ValueError(f"{directory} was written on a machine of another byte order.")
+    self.directory = directory
+    self.rows = self.meta['rows']
+    self.dictionaries = self.meta['dictionaries']
+    self.project_ranges = {project: tuple(bounds) for project, bounds in self.meta['project_ranges'].items()}
+
+  @classmethod
+  def from_database(cls, db_path, directory=None):
+    """Load the export of the database, exporting it first if it is missing or out of date."""
+    if directory is None:
+      directory = columns_path_for(db_path)
+    try:
+      corpus = cls(directory)
+      if corpus.meta['signature'] == database_signature(db_path):
+        return corpus
+    except (OSError, ValueError, KeyError):
+      pass
+    export_columns(db_path, directory)
+    return cls(directory)
+
+  def codes(self, name):
+    """The dictionary codes (project, filename) or the line numbers (linenum) of the rows."""
+    suffix = 'ints' if name == 'linenum' else 'codes'
+    return memoryview(map_file(os.path.join(self.directory, f"{name}.{suffix}"))).cast('I')
+
+  def flag(self, name):
+    return Bitmap(map_file(os.path.join(self.directory, f"{name}.bits")), self.rows)
+
+  def strings(self, name):
+    return Strings(self.directory, name, self.rows)
+
+def project_status(corpus):
+  """Return [(project, rows, approved, fuzzy)], counted on the bits of each project's rows."""
+  approved = corpus.flag('approved')
+  fuzzy = corpus.flag('fuzzy')
+  return [(project, end - start, approved.count(start, end), fuzzy.count(start, end))
+          for project, (start, end) in sorted(corpus.project_ranges.items())]
+
+def accelerator_counts(corpus):
+  """Count the (lowercase) letters used as accelerators in msgstr, with one regex pass."""
+  counts = Counter()
+  for match in ACCELERATOR.finditer(corpus.strings('msgstr').buffer()):
+    letter = match.group(1) and match.group(1).decode('utf-8', 'replace')
+    if letter and letter.isalpha():
+      counts[letter.lower()] += 1
+  return counts
+
+def letter_frequencies(corpus, alphabet='αβγδεζηθικλμνξοπρστυφχψω'):
+  """Return the percentage of each letter of `alphabet` among those letters in msgstr."""
+  counts = Counter(corpus.strings('msgstr').buffer().decode('utf-8').lower())
+  total = sum(counts[letter] for letter in alphabet)
+  return {letter: 100 * counts[letter] / total if total else 0.0 for letter in alphabet}
+
+def length_ratios(corpus):
+  """
+  Return {project: msgstr bytes per msgid byte} over the approved entries. Lengths are UTF-8
+  bytes, summed from the offsets of each run of approved rows without decoding any text, so
+  text in a non-Latin script counts about two bytes per character.
+  """
+  approved = corpus.flag('approved')
+  msgid_offsets = corpus.strings('msgid').offsets
+  msgstr_offsets = corpus.strings('msgstr').offsets
+  ratios = {}
+  for project, (start, end) in sorted(corpus.project_ranges.items()):
+    msgid_length = 0
+    msgstr_length = 0
+    for run_start, run_end in approved.runs(start, end):
+      msgid_length += msgid_offsets[run_end] - msgid_offsets[run_start]
+      msgstr_length += msgstr_offsets[run_end] - msgstr_offsets[run_start]
+    ratios[project] = msgstr_length / msgid_length if msgid_length else 0.0
+  return ratios
+
+def main():
+  parser = argparse.ArgumentParser(description="Export the l10n database to columns and print corpus statistics.")
+  parser.add_argument('--db', default=database_path, help="The l10n database to export.")
+  parser.add_argument('--columns', help="The export directory (default: next to the database).")
+  parser.add_argument('--export', action='store_true', help="Export again even if the database did not change.")
+  args = parser.parse_args()
+
+  directory = args.columns or columns_path_for(args.db)
+  if args.export:
+    export_columns(args.db, directory)
+  corpus = ColumnarCorpus.from_database(args.db, directory)
+  ratios = length_ratios(corpus)
+  print(f"{'project':24} {'entries':>8} {'approved':>9} {'fuzzy':>7} {'bytes':>7}")
+  for project, rows, approved, fuzzy in project_status(corpus):
+    print(f"{project:24} {rows:8} {approved / rows:9.1%} {fuzzy / rows:7.1%} {ratios[project]:7.2f}")
+  print("\nAccelerator letters:")
+  accelerators = accelerator_counts(corpus)
+  print('  '.join(f"{letter} {count}" for letter, count in accelerators.most_common(24)))
+  print("\nLetter frequencies of msgstr (%):")
+  frequencies = letter_frequencies(corpus)
+  print('  '.join(f"{letter} {frequency:.2f}" for letter, frequency in
+                  sorted(frequencies.items(), key=lambda item: -item[1])))
+
+if __name__ == "__main__":
+  main()
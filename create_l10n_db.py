@@ -1,6 +1,15 @@
 import os
+import sys
+import time
 import sqlite3
-import polib
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from scan_cache import file_digest
+from po_reader import iter_po_entries
+from profiling import STATS, add_profiling_arguments, run_profiled
+from l10n_normalized import (is_normalized, create_normalized_database, create_normalized_indexes,
+                             normalized_index_names, prune_strings, NormalizedWriter)
 
 # ----------------------------- Configuration ----------------------------- #
 
@@ -13,31 +22,62 @@ database_path = "kde_l10n_el.db"  # Replace with desired DB path
 # Batch size for inserting records
 batch_size = 1000
 
+# Page cache used by the bulk load mode, in KiB
+bulk_cache_size = 256 * 1024
+
+# Files handed to each worker process ahead of the writer in a parallel import
+parse_ahead = 4
+
+# Indexes built by create_indexes
+index_names = ['idx_project', 'idx_filename', 'idx_project_filename', 'idx_translated',
+               'idx_fuzzy_obsolete', 'idx_untranslated']
+
 # ----------------------------- Functions ----------------------------- #
 
-def create_database(conn):
+def create_database(conn, normalized=False):
   """
   Creates the translations table in the SQLite database with simplified fields.
+  With `normalized`, creates the normalized tables and a translations view instead.
   """
   cursor = conn.cursor()
+  cursor.execute("SELECT type FROM sqlite_master WHERE name = 'translations'")
+  existing = cursor.fetchone()
+  if normalized and existing == ('table',):
+    raise ValueError("The database already uses the flat translations table.")
+  if normalized or existing == ('view',):
+    create_normalized_database(conn)
+  else:
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS translations (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      project TEXT,
+      filename TEXT,
+      msgid TEXT,
+      msgstr TEXT,
+      msgid_plural TEXT,
+      msgstr_plural TEXT,
+      msgctxt TEXT,
+      occurrences TEXT,
+      previous_msgctxt TEXT,
+      previous_msgid TEXT,
+      previous_msgid_plural TEXT,
+      linenum INTEGER,
+      approved BOOLEAN,
+      fuzzy BOOLEAN,
+      obsolete BOOLEAN
+    )
+    ''')
+  # Imported .po files, used to only re-import the files that changed
   cursor.execute('''
-  CREATE TABLE IF NOT EXISTS translations (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
+  CREATE TABLE IF NOT EXISTS files (
     project TEXT,
     filename TEXT,
-    msgid TEXT,
-    msgstr TEXT,
-    msgid_plural TEXT,
-    msgstr_plural TEXT,
-    msgctxt TEXT,
-    occurrences TEXT,
-    previous_msgctxt TEXT,
-    previous_msgid TEXT,
-    previous_msgid_plural TEXT,
-    linenum INTEGER,
-    approved BOOLEAN,
-    fuzzy BOOLEAN,
-    obsolete BOOLEAN
+    mtime INTEGER,
+    size INTEGER,
+    hash TEXT,
+    fuzzy INTEGER,
+    rows INTEGER,
+    PRIMARY KEY (project, filename)
   )
   ''')
   conn.commit()
@@ -46,17 +86,271 @@ def create_indexes(conn):
   """
   Creates indexes on key columns to optimize query performance.
   """
+  if is_normalized(conn):
+    create_normalized_indexes(conn)
+    return
   cursor = conn.cursor()
   cursor.execute("CREATE INDEX IF NOT EXISTS idx_project ON translations(project)")
   cursor.execute("CREATE INDEX IF NOT EXISTS idx_filename ON translations(filename)")
+  cursor.execute("CREATE INDEX IF NOT EXISTS idx_project_filename ON translations(project, filename)") # file updates
   cursor.execute("CREATE INDEX IF NOT EXISTS idx_translated ON translations(approved)") # translated_entries()
   cursor.execute("CREATE INDEX IF NOT EXISTS idx_fuzzy_obsolete ON translations(fuzzy, obsolete)") # fuzzy_entries()
   cursor.execute("CREATE INDEX IF NOT EXISTS idx_untranslated ON translations(approved, fuzzy, obsolete)") # untranslated_entries()
   conn.commit()
 
-def parse_po_files(base_dir, conn, skip_dir_callback=None, skip_entry_callback=None):
+def has_search_index(conn):
+  """
+  Checks whether the database has the translations_fts full-text index.
+  """
+  cursor = conn.cursor()
+  cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'translations_fts'")
+  return cursor.fetchone() is not None
+
+def create_search_index(conn):
+  """
+  Creates the translations_fts full-text index over msgid and msgstr, using the trigram
+  tokenizer for substring search, and fills it from the current rows. Triggers keep it
+  in sync with later imports. Does nothing if it already exists.
+  """
+  if has_search_index(conn):
+    return
+  cursor = conn.cursor()
+  cursor.execute('''
+  CREATE VIRTUAL TABLE translations_fts USING fts5(
+    msgid, msgstr, content='translations', content_rowid='id', tokenize='trigram'
+  )
+  ''')
+  if is_normalized(conn):
+    # The view cannot carry triggers for inserts, follow the entries table instead
+    cursor.execute('''
+    CREATE TRIGGER translations_fts_insert AFTER INSERT ON entries BEGIN
+      INSERT INTO translations_fts (rowid, msgid, msgstr) VALUES (
+        NEW.id,
+        (SELECT text FROM msgids WHERE id = NEW.msgid_id),
+        (SELECT text FROM msgstrs WHERE id = NEW.msgstr_id));
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER translations_fts_delete AFTER DELETE ON entries BEGIN
+      INSERT INTO translations_fts (translations_fts, rowid, msgid, msgstr) VALUES (
+        'delete',
+        OLD.id,
+        (SELECT text FROM msgids WHERE id = OLD.msgid_id),
+        (SELECT text FROM msgstrs WHERE id = OLD.msgstr_id));
+    END
+    ''')
+  else:
+    cursor.execute('''
+    CREATE TRIGGER translations_fts_insert AFTER INSERT ON translations BEGIN
+      INSERT INTO translations_fts (rowid, msgid, msgstr) VALUES (NEW.id, NEW.msgid, NEW.msgstr);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER translations_fts_delete AFTER DELETE ON translations BEGIN
+      INSERT INTO translations_fts (translations_fts, rowid, msgid, msgstr)
+      VALUES ('delete', OLD.id, OLD.msgid, OLD.msgstr);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER translations_fts_update AFTER UPDATE OF msgid, msgstr ON translations BEGIN
+      INSERT INTO translations_fts (translations_fts, rowid, msgid, msgstr)
+      VALUES ('delete', OLD.id, OLD.msgid, OLD.msgstr);
+      INSERT INTO translations_fts (rowid, msgid, msgstr) VALUES (NEW.id, NEW.msgid, NEW.msgstr);
+    END
+    ''')
+  cursor.execute("INSERT INTO translations_fts (translations_fts) VALUES ('rebuild')")
+  conn.commit()
+
+def drop_indexes(conn):
+  """
+  Drops the indexes so a bulk import does not have to maintain them row by row.
+  """
+  cursor = conn.cursor()
+  for index_name in normalized_index_names if is_normalized(conn) else index_names:
+    cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+  conn.commit()
+
+def begin_bulk_load(conn):
+  """
+  Tunes the connection for importing everything in a single, non-durable transaction.
+  """
+  cursor = conn.cursor()
+  cursor.execute("PRAGMA journal_mode=WAL")
+  cursor.execute("PRAGMA synchronous=OFF")
+  cursor.execute(f"PRAGMA cache_size=-{bulk_cache_size}")
+  cursor.execute("PRAGMA temp_store=MEMORY")
+
+def end_bulk_load(conn):
+  """
+  Folds the WAL back into the database and restores the default, durable settings.
+  """
+  conn.commit()
+  cursor = conn.cursor()
+  cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+  cursor.execute("PRAGMA journal_mode=DELETE")
+  cursor.execute("PRAGMA synchronous=FULL")
+  cursor.execute("PRAGMA cache_size=-2000")
+  cursor.execute("PRAGMA temp_store=DEFAULT")
+
+# Position of the fuzzy flag in the rows built by parse_po_file_rows
+FUZZY_COLUMN = 13
+
+def parse_po_file_rows(file_path, project, skip_entry_callback=None):
+  """
+  Parse a .po file with the streaming reader and return its rows for the translations table.
+  """
+  rows = []
+  for entry in iter_po_entries(file_path):
+    # Skip entries based on the provided callback
+    if skip_entry_callback and skip_entry_callback(entry):
+      continue
+    # Handle msgstr_plural and msgstr
+    msgstr = entry.msgstr
+    if entry.msgstr_plural:
+      msgstr = entry.msgstr_plural[0]
+    msgstr_plural = None
+    is_msgstr_plural = bool(entry.msgstr_plural) and 1 in entry.msgstr_plural
+    if is_msgstr_plural:
+      msgstr_plural = entry.msgstr_plural[1]
+    # Serialize occurrences as comma-separated string
+    occurrences = ','.join(f"{source_file}:{linenum}" for source_file, linenum in entry.occurrences)
+    # Determine if 'fuzzy' flag is present
+    is_fuzzy = 'fuzzy' in entry.flags
+    # Determine the translated status
+    is_approved = bool(msgstr) and not (is_fuzzy or entry.obsolete) and \
+        is_msgstr_plural == bool(msgstr_plural) # XNOR
+    # Prepare the entry tuple
+    entry = (
+      project,
+      os.path.basename(file_path),
+      entry.msgid,
+      msgstr,
+      entry.msgid_plural,
+      msgstr_plural,
+      entry.msgctxt,
+      occurrences,
+      entry.previous_msgctxt,
+      entry.previous_msgid,
+      entry.previous_msgid_plural,
+      entry.linenum,
+      is_approved,
+      is_fuzzy,
+      entry.obsolete
+    )
+    rows.append(entry)
+  return rows
+
+def parse_file(file_path, project, skip_entry_callback=None):
+  """
+  Parse a .po file into its rows, returning them with the file's mtime, size and content hash.
+  Runs in the worker processes of a parallel import.
+  """
+  stat = os.stat(file_path)
+  rows = parse_po_file_rows(file_path, project, skip_entry_callback)
+  STATS.count('rows', len(rows))
+  with STATS.phase('cache'):
+    digest = file_digest(file_path)
+  return rows, stat.st_mtime_ns, stat.st_size, digest
+
+def init_worker(collect_stats=False):
+  """Start the statistics of a worker process afresh and drop the cProfile hook of --profile."""
+  # Forked workers inherit the statistics the parent recorded so far, which it already counts
+  STATS.clear()
+  if collect_stats:
+    STATS.enable()
+  sys.setprofile(None)
+
+def parse_file_measured(file_path, project, skip_entry_callback=None):
+  """
+  parse_file in a worker process, returning its result and the statistics collected meanwhile
+  (None if disabled), for the parent to merge.
+  """
+  with STATS.file(file_path), STATS.phase('parse'):
+    result = parse_file(file_path, project, skip_entry_callback)
+  return result, STATS.take() if STATS.enabled else None
+
+def parse_files(files, skip_entry_callback=None, jobs=1):
+  """
+  Parse the (file_path, project, record) items of `files` with parse_file, yielding each item
+  with its result, or the exception raised, in the order of `files`. With `jobs` > 1 the files
+  are parsed in worker processes, at most `parse_ahead` per worker ahead of the consumer, so
+  memory stays flat when writing falls behind.
+  """
+  if jobs <= 1:
+    for item in files:
+      try:
+        with STATS.file(item[0]), STATS.phase('parse'):
+          result = parse_file(item[0], item[1], skip_entry_callback)
+      except Exception as e:
+        result = e
+      yield item, result
+    return
+
+  def collect(pending):
+    item, future = pending.popleft()
+    try:
+      # The parsing itself is timed by the workers, this is the time spent waiting for them
+      with STATS.phase('parse-wait'):
+        result, stats = future.result()
+    except Exception as e:
+      return item, e
+    if stats is not None:
+      STATS.merge(stats)
+    return item, result
+
+  with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(STATS.enabled,)) as executor:
+    pending = deque()
+    for item in files:
+      pending.append((item, executor.submit(parse_file_measured, item[0], item[1], skip_entry_callback)))
+      if len(pending) >= jobs * parse_ahead:
+        yield collect(pending)
+    while pending:
+      yield collect(pending)
+
+def load_imported_files(conn):
+  """
+  Returns the files table as a dict mapping (project, filename) to (mtime, size, hash).
+  """
+  cursor = conn.cursor()
+  cursor.execute("SELECT project, filename, mtime, size, hash FROM files")
+  return {(project, filename): (mtime, size, digest)
+          for project, filename, mtime, size, digest in cursor}
+
+def is_unchanged(cursor, key, file_path, record):
+  """
+  Checks whether the file matches its record in the files table. The content hash is
+  only computed when the mtime changed but the size did not.
+  """
+  if record is None:
+    return False
+  mtime, size, digest = record
+  stat = os.stat(file_path)
+  if stat.st_size != size:
+    return False
+  if stat.st_mtime_ns != mtime:
+    if file_digest(file_path) != digest:
+      return False
+    # Touched but identical (e.g. by a checkout), remember the new mtime
+    cursor.execute("UPDATE files SET mtime = ? WHERE project = ? AND filename = ?",
+                   (stat.st_mtime_ns, *key))
+  return True
+
+def delete_file_rows(cursor, key):
+  """
+  Deletes the translations of a file together with its entry in the files table.
+  """
+  cursor.execute("DELETE FROM translations WHERE project = ? AND filename = ?", key)
+  cursor.execute("DELETE FROM files WHERE project = ? AND filename = ?", key)
+
+def parse_po_files(base_dir, conn, skip_dir_callback=None, skip_entry_callback=None, force=False,
+                   bulk=False, jobs=1):
   """
   Walk through the root directory, parse .po files, and insert entries into the database.
+  Only files that changed since the last import are parsed again (all of them with `force`),
+  their rows are replaced. Rows of files that no longer exist are removed. In `bulk` mode
+  everything is committed once at the end. With `jobs` > 1 the files are parsed in that many
+  worker processes while this thread, the only one writing to the database, inserts the rows.
+  Returns the number of inserted entries.
   """
   cursor = conn.cursor()
   # Prepare the insertion statement
@@ -68,72 +362,79 @@ def parse_po_files(base_dir, conn, skip_dir_callback=None, skip_entry_callback=N
   )
   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
   '''
+  record_query = '''
+  INSERT OR REPLACE INTO files (project, filename, mtime, size, hash, fuzzy, rows)
+  VALUES (?, ?, ?, ?, ?, ?, ?)
+  '''
+  if is_normalized(conn):
+    insert_rows = STATS.timed('db-insert')(NormalizedWriter(conn).insert)
+  else:
+    insert_rows = STATS.timed('db-insert')(lambda rows: cursor.executemany(insert_query, rows))
+  imported_files = load_imported_files(conn)
+  if not imported_files:
+    # Rows not tracked in the files table come from an older import and would be duplicated
+    cursor.execute("DELETE FROM translations")
   entries = []
   total_inserted = 0
+  skipped = 0
+  replaced = False
 
-  for root, dirs, files in os.walk(base_dir):
-    # Modify the dirs list in place using the callback
-    if skip_dir_callback:
-      skip_dir_callback(dirs)
-    for file in files:
-      if file.endswith('.po'):
-        file_path = os.path.join(root, file)
-        project = os.path.basename(root)
-        try:
-          po = polib.pofile(file_path)
-        except Exception as e:
-          print(f"Error parsing {file_path}: {e}")
-          continue
-        for entry in po:
-          # Skip entries based on the provided callback
-          if skip_entry_callback and skip_entry_callback(entry):
-            continue
-          # Handle msgstr_plural and msgstr
-          msgstr = entry.msgstr
-          if entry.msgstr_plural:
-            msgstr = entry.msgstr_plural[0]
-          msgstr_plural = None
-          is_msgstr_plural = bool(entry.msgstr_plural) and 1 in entry.msgstr_plural
-          if is_msgstr_plural:
-            msgstr_plural = entry.msgstr_plural[1]
-          # Serialize occurrences as comma-separated string
-          occurrences = ','.join(f"{source_file}:{linenum}" for source_file, linenum in entry.occurrences)
-          # Determine if 'fuzzy' flag is present
-          is_fuzzy = 'fuzzy' in entry.flags
-          # Determine the translated status
-          is_approved = bool(msgstr) and not (is_fuzzy or entry.obsolete) and \
-              is_msgstr_plural == bool(msgstr_plural) # XNOR
-          # Prepare the entry tuple
-          entry = (
-            project,
-            file,
-            entry.msgid,
-            msgstr,
-            entry.msgid_plural,
-            msgstr_plural,
-            entry.msgctxt,
-            occurrences,
-            entry.previous_msgctxt,
-            entry.previous_msgid,
-            entry.previous_msgid_plural,
-            entry.linenum,
-            is_approved,
-            is_fuzzy,
-            entry.obsolete
-          )
-          entries.append(entry)
-          # Insert in batches
-          if len(entries) >= batch_size:
-            cursor.executemany(insert_query, entries)
-            conn.commit()
-            total_inserted += len(entries)
-            entries = []
+  def changed_files():
+    nonlocal skipped
+    for root, dirs, files in os.walk(base_dir):
+      # Modify the dirs list in place using the callback
+      if skip_dir_callback:
+        skip_dir_callback(dirs)
+      for file in files:
+        if file.endswith('.po'):
+          file_path = os.path.join(root, file)
+          project = os.path.basename(root)
+          record = imported_files.pop((project, file), None)
+          with STATS.phase('cache'):
+            unchanged = not force and is_unchanged(cursor, (project, file), file_path, record)
+          if unchanged:
+            skipped += 1
+          else:
+            yield file_path, project, record
+
+  for (file_path, project, record), result in parse_files(changed_files(), skip_entry_callback, jobs):
+    key = (project, os.path.basename(file_path))
+    if record is not None:
+      # Drop the rows of the previous import of this file
+      delete_file_rows(cursor, key)
+      replaced = True
+    if isinstance(result, Exception):
+      print(f"Error parsing {file_path}: {result}")
+      continue
+    file_entries, mtime, size, digest = result
+    entries.extend(file_entries)
+    file_fuzzy = sum(1 for row in file_entries if row[FUZZY_COLUMN])
+    cursor.execute(record_query, (*key, mtime, size, digest, file_fuzzy, len(file_entries)))
+    # Insert in batches
+    if len(entries) >= batch_size:
+      insert_rows(entries)
+      if not bulk:
+        with STATS.phase('db-commit'):
+          conn.commit()
+      total_inserted += len(entries)
+      entries = []
   # Insert any remaining entries
   if entries:
-    cursor.executemany(insert_query, entries)
-    conn.commit()
+    insert_rows(entries)
     total_inserted += len(entries)
+  # Whatever was not found in the walk has been deleted
+  for key in imported_files:
+    delete_file_rows(cursor, key)
+  with STATS.phase('db-commit'):
+    conn.commit()
+  if (replaced or imported_files) and is_normalized(conn):
+    prune_strings(conn)
+  if skipped > 0:
+    print(f"Skipped {skipped} unchanged files.")
+  if imported_files:
+    print(f"Removed the entries of {len(imported_files)} deleted files.")
   print(f"Inserted a total of {total_inserted} entries.")
+  return total_inserted
 
 # ----------------------------- Main Function ----------------------------- #
 
@@ -148,19 +449,53 @@ def skip_entry_cb(entry):
   skip_contexts = ["NAME OF TRANSLATORS", "EMAIL OF TRANSLATORS", "@info:credit"]
   return entry.msgctxt in skip_contexts
 
-def main():
+def parse_args():
+  parser = argparse.ArgumentParser(description="Import .po files into the l10n SQLite database.")
+  parser.add_argument('--force', action='store_true',
+                      help="Re-import every file, not only the ones that changed.")
+  parser.add_argument('--normalized', action='store_true',
+                      help="Create a new database with interned strings and a translations view.")
+  parser.add_argument('--fts', action='store_true',
+                      help="Build a full-text search index over msgid and msgstr.")
+  parser.add_argument('--bulk', action='store_true',
+                      help="Import in a single transaction with journaling and syncing relaxed.")
+  parser.add_argument('--jobs', '-j', type=int, default=1,
+                      help="Parse the files in this many worker processes (default: 1).")
+  add_profiling_arguments(parser)
+  return parser.parse_args()
+
+def populate_database(args):
   # Connect to the SQLite database
   conn = sqlite3.connect(database_path)
   try:
     print("Setting up the database...")
-    create_database(conn)
+    create_database(conn, args.normalized)
+    if args.bulk:
+      begin_bulk_load(conn)
+      # Indexes are only worth deferring when the whole table is rebuilt,
+      # replacing the rows of changed files needs them
+      if conn.execute("SELECT 1 FROM translations LIMIT 1").fetchone() is None:
+        drop_indexes(conn)
     print("Parsing and inserting data...")
-    parse_po_files(base_dir, conn, skip_dir_cb, skip_entry_cb)
+    start_time = time.perf_counter()
+    total_inserted = parse_po_files(base_dir, conn, skip_dir_cb, skip_entry_cb, args.force, args.bulk, args.jobs)
+    elapsed = time.perf_counter() - start_time
+    if total_inserted > 0:
+      print(f"Imported {total_inserted / elapsed:.0f} rows per second.")
     print("Creating indexes...")
-    create_indexes(conn)
+    with STATS.phase('indexes'):
+      create_indexes(conn)
+      if args.fts:
+        create_search_index(conn)
+    if args.bulk:
+      end_bulk_load(conn)
     print("Database population complete.")
   finally:
     conn.close()
 
+def main():
+  args = parse_args()
+  run_profiled(args, populate_database, args)
+
 if __name__ == "__main__":
   main()
@@ -0,0 +1,115 @@
+import os
+import sys
+import time
+import argparse
+from difflib import SequenceMatcher
+from po_reader import iter_po_entries
+
+# Levenshtein distance bounded by a maximum, for deciding whether a fuzzy
+# msgid is only a few characters away from its previous version. Uses the
+# diagonal transition algorithm of Ukkonen and Landau-Vishkin: for each
+# number of edits e it keeps, on each of the 2e + 1 diagonals of the DP
+# matrix around the main one, the furthest cell reachable with e edits,
+# then slides along the diagonal over equal characters. Slides compare whole
+# slices instead of single characters, so a check costs O(k^2) slice
+# comparisons and gives up after `max_distance` rounds.
+
+def common_prefix_length(str1, start1, str2, start2):
+  """Return the length of the common prefix of str1[start1:] and str2[start2:]."""
+  limit = min(len(str1) - start1, len(str2) - start2)
+  if limit <= 0 or str1[start1] != str2[start2]:
+    return 0
+  # Gallop over equal blocks of doubling size, then bisect the first unequal one
+  low = 1
+  step = 8
+  while low + step <= limit and str1[start1 + low:start1 + low + step] == str2[start2 + low:start2 + low + step]:
+    low += step
+    step *= 2
+  high = min(low + step, limit + 1)
+  while high - low > 1:
+    middle = (low + high) // 2
+    if str1[start1 + low:start1 + middle] == str2[start2 + low:start2 + middle]:
+      low = middle
+    else:
+      high = middle
+  return low
+
+def bounded_edit_distance(str1, str2, max_distance):
+  """
+  Return the Levenshtein distance between str1 and str2 if it is at most `max_distance`,
+  otherwise `max_distance + 1`.
+  """
+  length1 = len(str1)
+  length2 = len(str2)
+  if abs(length1 - length2) > max_distance:
+    return max_distance + 1
+  # Diagonal d holds the cells (row, row + d); the distance is found on `target` at the last row
+  target = length2 - length1
+  furthest = {0: common_prefix_length(str1, 0, str2, 0)}
+  if target == 0 and furthest[0] == length1:
+    return 0
+  for distance in range(1, max_distance + 1):
+    previous = furthest
+    furthest = {}
+    for diagonal in range(max(-distance, -length1), min(distance, length2) + 1):
+      # A substitution, a deletion or an insertion from the previous round
+      row = max(previous.get(diagonal, -2) + 1,
+                previous.get(diagonal + 1, -2) + 1,
+                previous.get(diagonal - 1, -1))
+      row = min(row, length1, length2 - diagonal)
+      if row < 0 or row + diagonal < 0:
+        continue
+      row += common_prefix_length(str1, row, str2, row + diagonal)
+      furthest[diagonal] = row
+      if diagonal == target and row == length1:
+        return distance
+  return max_distance + 1
+
+def sequence_matcher_diff(str1, str2):
+  """The character difference estimated from SequenceMatcher.ratio(), as used before."""
+  matcher = SequenceMatcher(None, str1, str2)
+  return int((1 - matcher.ratio()) * max(len(str1), len(str2)))
+
+def collect_fuzzy_pairs(directory):
+  """Return the (previous_msgid, msgid) pairs of the fuzzy entries under directory."""
+  pairs = []
+  for root, _, files in os.walk(directory):
+    for file in files:
+      if file.endswith('.po'):
+        for entry in iter_po_entries(os.path.join(root, file)):
+          if entry.fuzzy and entry.previous_msgid is not None:
+            pairs.append((entry.previous_msgid, entry.msgid))
+  return pairs
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark the bounded edit distance against SequenceMatcher "
+                                               "on the fuzzy entries of a directory.")
+  parser.add_argument('directory', help="The directory with the .po files to read.")
+  parser.add_argument('--max-char-diff', type=int, default=2, help="The maximum number of character differences.")
+  parser.add_argument('--repeat', type=int, default=5, help="The number of passes over the pairs.")
+  args = parser.parse_args()
+
+  pairs = collect_fuzzy_pairs(args.directory)
+  if not pairs:
+    print("No fuzzy entries with a previous msgid found.")
+    return 1
+
+  start = time.perf_counter()
+  for _ in range(args.repeat):
+    old = [sequence_matcher_diff(str1, str2) <= args.max_char_diff for str1, str2 in pairs]
+  old_time = time.perf_counter() - start
+
+  start = time.perf_counter()
+  for _ in range(args.repeat):
+    new = [bounded_edit_distance(str1, str2, args.max_char_diff) <= args.max_char_diff for str1, str2 in pairs]
+  new_time = time.perf_counter() - start
+
+  calls = len(pairs) * args.repeat
+  print(f"{len(pairs)} fuzzy pairs, {args.repeat} passes")
+  print(f"SequenceMatcher:        {old_time / calls * 1e6:8.1f} µs per pair, {sum(old)} within {args.max_char_diff}")
+  print(f"Bounded edit distance:  {new_time / calls * 1e6:8.1f} µs per pair, {sum(new)} within {args.max_char_diff}")
+  print(f"Speedup: {old_time / new_time:.1f}x, the two disagree on {sum(a != b for a, b in zip(old, new))} pairs")
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -1,96 +1,35 @@
 import random
 import os
+import sys
 import string
 import polib
+import argparse
 from termcolor import colored
 from difflib import SequenceMatcher
+from scan_cache import ScanCache
+from po_writer import save_changed_entries
+from change_plan import PlanWriter, change_record, apply_plan
+from po_prefilter import has_excluded_accelerators
+from profiling import STATS, add_profiling_arguments, run_profiled
+from locale_packs import pack_for, use_model
+from accelerators import (count_unescaped_ampersands, remove_unescaped_ampersand, assign_ampersand_randomly,
+                          accelerator_letters, sibling_accelerators, file_seed, DEFAULT_MODEL_PATH)
 
 # Warning: BUG
 # msgid "&Quit <application>%1</application>"
 # -msgstr "&Έξοδος <application>%1</application>"
 # +msgstr "Έξοδος <applicatio&n>%1</application>"
 
-# Letter Frequencies of the Greek language
-GREEK_LETTER_PENALTIES = {
-  'α': 10.81, 'τ': 7.99, 'ο': 7.23, 'ε': 7.18, 'σ': 7.00, 'ι': 6.64,
-  'ν': 6.19, 'ρ': 4.32, 'π': 4.15, 'κ': 3.77, 'μ': 3.43, 'η': 3.18,
-  'υ': 3.04, 'λ': 2.66, 'γ': 1.70, 'δ': 1.63, 'χ': 1.29, 'ω': 1.23,
-  'θ': 1.22, 'φ': 0.74, 'β': 0.67, 'ξ': 0.44, 'ζ': 0.33, 'ψ': 0.15
-}
-
-# List of Greek letters to exclude
-EXCLUDED_LETTERS = {'ά', 'έ', 'ή', 'ί', 'ό', 'ύ', 'ώ', 'ϊ', 'ϋ', 'ΐ', 'ΰ', 'ς'}
-
-def detect_invalid_ampersand_usage(msgstr):
-  """Detect non-escaped ampersands (&) that precede certain Greek characters."""
+def detect_invalid_ampersand_usage(msgstr, locale):
+  """Detect non-escaped ampersands (&) that precede one of the excluded letters of the `locale` pack."""
   # Remove escaped ampersands (&&)
   cleaned_str = msgstr.replace('&&', '')
   for i in range(len(cleaned_str) - 1):
-    if cleaned_str[i] == '&' and cleaned_str[i + 1].lower() in EXCLUDED_LETTERS:
+    if cleaned_str[i] == '&' and locale.lower(cleaned_str[i + 1]) in locale.excluded_letters:
       return True
   return False
 
-def remove_unescaped_ampersand(msgstr, count_to_remove):
-  """
-  Remove only unescaped ampersands (&) from the string, leaving escaped ampersands (&&) intact.
-  `count_to_remove` specifies how many ampersands to remove.
-  """
-  result = []
-  i = 0
-  ampersands_removed = 0
-  while i < len(msgstr):
-    # Check for escaped ampersands (&&)
-    if msgstr[i:i+2] == '&&':
-      result.append('&&')
-      i += 2  # Skip both '&'
-    elif msgstr[i] == '&' and ampersands_removed < count_to_remove:
-      # Remove the unescaped ampersand
-      ampersands_removed += 1
-      i += 1  # Skip this '&'
-    else:
-      result.append(msgstr[i])
-      i += 1
-  return ''.join(result)
-
-def assign_ampersand_randomly(msgstr, ampersands_to_add):
-  """
-  Assign ampersands randomly to letters in msgstr.
-  Penalize common Greek letters and exclude vowels with diacritics.
-  """
-  # Filter out excluded vowels and create a list of unique letters in the msgstr
-  unique_letters = [ch for ch in set(msgstr.lower()) if ch not in EXCLUDED_LETTERS and ch.isalpha()]
-
-  if not unique_letters:
-    # No valid letters to assign ampersands, return unchanged msgstr
-    return msgstr
-
-  # Create a list of letters with their penalties
-  weighted_letters = []
-  for letter in unique_letters:
-    penalty = GREEK_LETTER_PENALTIES.get(letter, 1)  # Higher penalty for common letters
-    weighted_letters.extend([letter] * int(100 / penalty))  # More penalty = fewer chances
-
-  # Randomly assign ampersands to letters in msgstr
-  for _ in range(ampersands_to_add):
-    chosen_letter = random.choice(weighted_letters)
-    msgstr = insert_ampersand_before_letter(msgstr, chosen_letter)
-  return msgstr
-
-def insert_ampersand_before_letter(msgstr, letter):
-  """Insert ampersand (&) before the first occurrence of the chosen letter (lowercase or uppercase) in msgstr."""
-  lower_letter = letter.lower()
-  upper_letter = letter.upper()
-
-  lower_index = msgstr.find(lower_letter)
-  upper_index = msgstr.find(upper_letter)
-
-  if lower_index == -1 and upper_index == -1:
-    return msgstr # cannot happen
-  elif lower_index == -1 or (upper_index != -1 and upper_index < lower_index):
-    return msgstr.replace(upper_letter, f'&{upper_letter}', 1)
-  else:
-    return msgstr.replace(lower_letter, f'&{lower_letter}', 1)
-
+@STATS.timed('diff-render')
 def colored_inline_diff(str1, str2):
   # Create a SequenceMatcher object
   matcher = SequenceMatcher(None, str1, str2)
@@ -121,18 +60,19 @@ def print_change(text):
 def print_unchanged(text):
   print(colored(f"  ↳ {text}", "dark_grey"))
 
-def edit_msgstr(entry, filepath):
+def edit_msgstr(entry, filepath, locale, avoid=()):
+  """Move accelerators off the excluded letters of the `locale`, avoiding the letters in `avoid` if possible."""
   old_msgstr = entry.msgstr
 
-  if old_msgstr and detect_invalid_ampersand_usage(old_msgstr) and \
+  if old_msgstr and detect_invalid_ampersand_usage(old_msgstr, locale) and \
       not entry.msgstr_plural:
     print_header(f"Editing entry in {filepath}:{entry.linenum}")
     print_subheader(f"Detected invalid ampersand usage in msgstr:")
     print(entry.msgid)
 
-    ampersands_count = old_msgstr.count('&') - old_msgstr.count('&&') * 2
+    ampersands_count = count_unescaped_ampersands(old_msgstr)
     new_msgstr = remove_unescaped_ampersand(old_msgstr, ampersands_count)
-    new_msgstr = assign_ampersand_randomly(new_msgstr, ampersands_count)
+    new_msgstr = assign_ampersand_randomly(new_msgstr, ampersands_count, locale, avoid)
 
     print_change("Entry updated automatically:")
     colored_inline_diff(old_msgstr, new_msgstr)
@@ -142,28 +82,115 @@ def edit_msgstr(entry, filepath):
   else:
     return False
 
-def process_po_file(filepath):
-  """Process the .po file and handle fuzzy entries."""
-  po = polib.pofile(filepath, encoding='utf-8', wrapwidth=80)
+def process_po_file(filepath, dry_run=False, seed=None):
+  """
+  Process the .po file and handle fuzzy entries. Returns the number of changes and the change
+  plan records. With `dry_run` nothing is saved, with a `seed` the random choices are
+  reproducible. Files without accelerators on excluded letters are not parsed.
+  """
+  with STATS.phase('prefilter'):
+    candidate = has_excluded_accelerators(filepath)
+  if not candidate:
+    STATS.count('prefiltered')
+    return 0, []
+  if seed is not None:
+    random.seed(seed)
+  with STATS.phase('parse'):
+    po = polib.pofile(filepath, encoding='utf-8', wrapwidth=80)
+  # The conventions of the file's language
+  locale = pack_for(po)
+  # Accelerators used by the entries of each msgctxt
+  used_accelerators = sibling_accelerators(po, locale.lower)
   count = 0
-  for entry in po.translated_entries():
-    if edit_msgstr(entry, filepath):
+  changed_entries = []
+  changes = []
+  with STATS.phase('filter'):
+    translated_entries = po.translated_entries()
+  STATS.count('translated', len(translated_entries))
+  for entry in translated_entries:
+    old_msgstr = entry.msgstr
+    siblings = used_accelerators.get(entry.msgctxt, ()) if entry.msgctxt is not None else ()
+    with STATS.phase('transform'):
+      changed = edit_msgstr(entry, filepath, locale, siblings)
+    if changed:
+      if entry.msgctxt is not None:
+        used_accelerators.setdefault(entry.msgctxt, set()).update(accelerator_letters(entry.msgstr, locale.lower))
       count += 1
-  if count > 0:
+      changed_entries.append(entry)
+      changes.append(change_record('fix_keybindings', ['invalid_ampersand'], filepath, entry,
+                                   old_msgstr, entry.msgstr_plural))
+  STATS.count('changes', count)
+  if count > 0 and not dry_run:
     print_info(f"Saving changes to {filepath}...")
-    po.save()
-  return count
+    save_changed_entries(po, changed_entries)
+  return count, changes
 
-def scan_directory(directory):
-  """Scan the directory for .po files and process them."""
+def scan_directory(directory, cache=None, report=None, seed=None):
+  """
+  Scan the directory for .po files and process them, skipping files unchanged in `cache`.
+  With a `report` PlanWriter this is a dry run: the changes are written to the plan instead.
+  With a `seed`, each file gets its own seed derived from it.
+  """
+  dry_run = report is not None
   count = 0
-  for root, _, files in os.walk(directory):
-    for file in files:
-      if file.endswith('.po'):
-        filepath = os.path.join(root, file)
-        count += process_po_file(filepath)
-  print_info(f"Changes made: {count}")
+  skipped = 0
+  with STATS.phase('walk'):
+    filepaths = [os.path.join(root, file) for root, _, files in os.walk(directory)
+                 for file in files if file.endswith('.po')]
+  for filepath in filepaths:
+    with STATS.phase('cache'):
+      unchanged = cache and cache.lookup(filepath) is not None
+    if unchanged:
+      skipped += 1
+      continue
+    with STATS.file(filepath):
+      file_count, changes = process_po_file(
+        filepath, dry_run, None if seed is None else file_seed(seed, os.path.relpath(filepath, directory)))
+    if dry_run:
+      report.write(changes)
+    elif cache:
+      cache.record(filepath, {'changes': file_count})
+    count += file_count
+  if skipped > 0:
+    print_info(f"Skipped {skipped} unchanged files.")
+  if dry_run:
+    print_info(f"Changes planned: {count}, written to {report.path}")
+  else:
+    print_info(f"Changes made: {count}")
 
 if __name__ == "__main__":
-  directory = input("Enter the directory to scan for .po files: ").strip()
-  scan_directory(directory)
+  parser = argparse.ArgumentParser(description="An automatic tool to fix invalid keyboard accelerators.")
+  parser.add_argument("directory", nargs="?", help="The directory to scan for .po files.")
+  parser.add_argument("--cache-file", default=".fix_keybindings_cache.json",
+                      help="Manifest used to skip files unchanged since the last run.")
+  parser.add_argument("--force", action="store_true",
+                      help="Ignore the manifest and process every file.")
+  parser.add_argument("--dry-run", action="store_true",
+                      help="Write the changes to the --report plan instead of the files.")
+  parser.add_argument("--report", help="The JSON Lines change plan written by --dry-run.")
+  parser.add_argument("--apply", metavar="PLAN", help="Apply a change plan written by --dry-run and exit.")
+  parser.add_argument("--seed", type=int, help="Seed the accelerator choices, so that runs give identical diffs.")
+  parser.add_argument("--accelerator-model", default=DEFAULT_MODEL_PATH,
+                      help="The accelerator weights built by accelerator_model.py, used if the file exists.")
+  add_profiling_arguments(parser)
+  args = parser.parse_args()
+
+  if args.apply:
+    applied, stale = apply_plan(args.apply)
+    print_info(f"Changes applied: {applied}, stale: {stale}")
+    sys.exit(0)
+  if args.dry_run != bool(args.report):
+    parser.error("--dry-run and --report go together")
+  directory = args.directory
+  if directory is None:
+    directory = input("Enter the directory to scan for .po files: ").strip()
+  if os.path.exists(args.accelerator_model):
+    use_model(args.accelerator_model)
+  cache = ScanCache(args.cache_file, args.force)
+  report = PlanWriter(args.report) if args.dry_run else None
+  try:
+    run_profiled(args, scan_directory, directory, cache, report, args.seed)
+  finally:
+    cache.save()
+    if report:
+      report.close()
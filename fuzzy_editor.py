@@ -3,11 +3,24 @@ import polib
 from termcolor import colored
 from difflib import SequenceMatcher
 from prompt_toolkit import prompt
-import string
+from po_writer import save_changed_entries, BackgroundWriter
+from session_journal import SessionJournal
+from fuzzy_queue import ORDERS, fuzzy_work, select_queued
+from translation_memory import TranslationMemory
+from edit_distance import bounded_edit_distance
+from locale_packs import pack_for
+from po_prefilter import has_fuzzy_entries
+from change_classifier import PUNCTUATION_KINDS, classify_changes, differs_by_punctuation
+from profiling import STATS, add_profiling_arguments, run_profiled
 import select
 import sys
 import time
+import queue
 import argparse
+import threading
+
+# Files parsed and filtered ahead of the one being edited
+PREFETCH_FILES = 4
 
 def highlight_spaces(text):
   translation_table = str.maketrans({
@@ -17,6 +30,7 @@ def highlight_spaces(text):
   })
   return text.translate(translation_table)
 
+@STATS.timed('diff-render')
 def colored_inline_diff(str1, str2):
   # Create a SequenceMatcher object
   matcher = SequenceMatcher(None, str1, str2)
@@ -33,6 +47,7 @@ def colored_inline_diff(str1, str2):
           colored(highlight_spaces(str2[j1:j2]), 'green'), end='')
   print()  # Add a newline at the end
 
+@STATS.timed('diff-render')
 def print_old_message(str1, str2):
   matcher = SequenceMatcher(None, str1, str2)
   for op, i1, i2, j1, j2 in matcher.get_opcodes():
@@ -43,6 +58,7 @@ def print_old_message(str1, str2):
       print(colored(highlighted, 'white', 'on_red'), end='')
   print()  # Add a newline at the end
 
+@STATS.timed('diff-render')
 def print_new_message(str1, str2):
   matcher = SequenceMatcher(None, str1, str2)
   for op, i1, i2, j1, j2 in matcher.get_opcodes():
@@ -92,8 +108,15 @@ def prefill_input(prompt_text, default_text):
   line_print()
   return result
 
-def edit_msgstr(entry, filepath):
-  """Function to edit msgstr with multiline editing support and pre-applied changes."""
+def print_suggestion(number, suggestion):
+  print(colored(f"{number}) ", "cyan") + suggestion.msgstr +
+        colored(f"  ({suggestion.score:.0%}, {suggestion.msgid})", "dark_grey"))
+
+def edit_msgstr(entry, filepath, locale, memory=None):
+  """
+  Function to edit msgstr with multiline editing support and pre-applied changes. The action
+  keys are also read in the keyboard layout of the `locale` pack.
+  """
   print_header(f"Editing fuzzy entry in {filepath}:{entry.linenum}")
 
   old_msgid = entry.previous_msgid
@@ -145,13 +168,29 @@ def edit_msgstr(entry, filepath):
   is_msgstr_plural = bool(entry.msgstr_plural) and 1 in entry.msgstr_plural
   if is_msgstr_plural:
     print(entry.msgstr_plural[1])
+  # Show similar approved translations from the translation memory
+  with STATS.phase('tm-lookup'):
+    suggestions = memory.lookup(new_msgid) if memory is not None else []
+  if suggestions:
+    print_subheader("Suggestions")
+    for number, suggestion in enumerate(suggestions, 1):
+      print_suggestion(number, suggestion)
+  suggestion_keys = [str(number) for number in range(1, len(suggestions) + 1)]
 
   # Prompt the user for action (edit, write, or skip)
   try:
     while True:
-      action = input("\nChoose an action - [E]dit, [W]rite, or [S]kip: ").strip().lower()
-      if action in ['e', 'ε']:
-        new_msgstr = prefill_input("msgstr[0]" if is_msgstr_plural else "msgstr", current_msgstr)
+      if suggestions:
+        action = input(f"\nChoose an action - [E]dit, [W]rite, [S]kip, or [1-{len(suggestions)}] "
+                       "to edit a suggestion: ").strip().lower()
+      else:
+        action = input("\nChoose an action - [E]dit, [W]rite, or [S]kip: ").strip().lower()
+      action = locale.action(action)
+      if action == 'e' or action in suggestion_keys:
+        default_msgstr = current_msgstr
+        if action in suggestion_keys:
+          default_msgstr = suggestions[int(action) - 1].msgstr
+        new_msgstr = prefill_input("msgstr[0]" if is_msgstr_plural else "msgstr", default_msgstr)
         new_msgstr_plural = None
         if is_msgstr_plural:
           new_msgstr_plural = prefill_input("msgstr[1]", entry.msgstr_plural[1])
@@ -174,10 +213,10 @@ def edit_msgstr(entry, filepath):
           else:
             entry.msgstr = new_msgstr
           return True
-      elif action in ['w', 'ς']:
+      elif action == 'w':
         # Just save the current msgstr
         return True
-      elif action in ['s', 'σ']:
+      elif action == 's':
         # Skip saving changes
         restore_original(entry)
         return False
@@ -187,10 +226,30 @@ def edit_msgstr(entry, filepath):
     raise
   return False # cannot happen
 
-def process_po_file(filepath, comparison_type, max_char_diff, no_comparison):
-  """Process the .po file and handle fuzzy entries."""
-  po = polib.pofile(filepath, encoding='utf-8', wrapwidth=80)
+def select_entries(po, comparison_type, max_char_diff, no_comparison):
+  """Return the fuzzy entries of po that should be edited."""
+  fuzzy_entries = po.fuzzy_entries()
+  if no_comparison:
+    return fuzzy_entries
+  if comparison_type == 'whitespace_punctuation':
+    # Classify the whole file at once, each distinct msgid change once
+    kinds = classify_changes([(entry.previous_msgid, entry.msgid) for entry in fuzzy_entries], max_char_diff)
+    return [entry for entry, kind in zip(fuzzy_entries, kinds) if kind in PUNCTUATION_KINDS]
+  return [entry for entry in fuzzy_entries if should_edit_entry(entry, comparison_type, max_char_diff)]
+
+def process_po_file(filepath, comparison_type, max_char_diff, no_comparison, memory=None,
+                    po=None, entries=None, writer=None, journal=None):
+  """
+  Process the .po file and handle fuzzy entries. An already parsed `po` can be passed with its
+  selected `entries`, and the changes handed to a BackgroundWriter instead of saved inline.
+  Skipped entries and the file once finished are recorded in the session `journal`.
+  """
+  if po is None:
+    po = polib.pofile(filepath, encoding='utf-8', wrapwidth=80)
+    entries = select_entries(po, comparison_type, max_char_diff, no_comparison)
+  locale = pack_for(po)
   count = 0
+  changed_entries = []
   should_quit = False  # Flag to indicate if we should break out of the loop
 
   def mark_entry_as_translated(entry):
@@ -200,32 +259,115 @@ def process_po_file(filepath, comparison_type, max_char_diff, no_comparison):
     entry.flags.remove('fuzzy')  # Remove the fuzzy flag
 
   try:
-    for entry in po.fuzzy_entries():
-      if no_comparison or should_edit_entry(entry, comparison_type, max_char_diff):
-        if edit_msgstr(entry, filepath):
-          count += 1
-          mark_entry_as_translated(entry)
+    for entry in entries:
+      # Mostly time spent waiting for the user
+      with STATS.phase('edit'):
+        edited = edit_msgstr(entry, filepath, locale, memory)
+      if edited:
+        count += 1
+        mark_entry_as_translated(entry)
+        changed_entries.append(entry)
+      elif journal is not None:
+        journal.record_skip(filepath, entry)
   except (KeyboardInterrupt, SystemExit):
     should_quit = True
+  # The file is finished once its changes are saved
+  on_saved = None
+  if journal is not None and not should_quit:
+    on_saved = lambda: journal.record_done(filepath)
   if count > 0:
     print_info(f"Saving changes to {filepath}...")
-    po.save()
+    if writer is not None:
+      writer.submit(po, changed_entries, on_saved)
+    else:
+      save_changed_entries(po, changed_entries)
+      if on_saved is not None:
+        on_saved()
+  elif on_saved is not None:
+    on_saved()
   return count, should_quit
 
-def scan_directory(directory, comparison_type, max_char_diff, no_comparison):
-  """Scan the directory for .po files and process them."""
+def prefetch_po_files(directory, comparison_type, max_char_diff, no_comparison, files, stop, journal=None,
+                      work=None):
+  """
+  Walk the directory, parsing the .po files and selecting their entries ahead of the editor.
+  Puts (filepath, po, entries) for the files with entries to edit into the bounded `files`
+  queue, then None. Stops early when the `stop` event is set. Files finished and entries
+  skipped according to the session `journal` are left out without parsing. With a `work`
+  queue from the database only its files are opened, and only its entries edited.
+  """
+  def put(item):
+    while not stop.is_set():
+      try:
+        files.put(item, timeout=0.1)
+        return True
+      except queue.Full:
+        pass
+    return False
+
+  if work is None:
+    work = ((os.path.join(root, name), None) for root, _, names in os.walk(directory)
+            for name in names if name.endswith('.po'))
+  try:
+    for filepath, keys in work:
+      if journal is not None and journal.is_done(filepath):
+        continue
+      try:
+        with STATS.file(filepath):
+          # Files without fuzzy entries are left out without parsing
+          with STATS.phase('prefilter'):
+            candidate = has_fuzzy_entries(filepath)
+          if not candidate:
+            STATS.count('prefiltered')
+            continue
+          with STATS.phase('parse'):
+            po = polib.pofile(filepath, encoding='utf-8', wrapwidth=80)
+          with STATS.phase('filter'):
+            entries = select_queued(select_entries(po, comparison_type, max_char_diff, no_comparison), keys)
+          STATS.count('selected', len(entries))
+      except IOError as e:
+        print_info(f"Cannot parse {filepath}: {e}")
+        continue
+      if journal is not None:
+        entries = [entry for entry in entries if not journal.is_skipped(filepath, entry)]
+        if not entries:
+          journal.record_done(filepath)
+      if entries and not put((filepath, po, entries)):
+        return
+  finally:
+    put(None)
+
+def scan_directory(directory, comparison_type, max_char_diff, no_comparison, memory=None, journal=None,
+                   work=None):
+  """
+  Scan the directory for .po files and process them. Upcoming files are parsed in a
+  background thread while the user edits, and finished files are saved in another one.
+  Progress is recorded in the session `journal`, if given. With a `work` queue (see
+  fuzzy_queue.py) only the files and entries it lists are processed, in its order.
+  """
   total_count = 0
-  for root, _, files in os.walk(directory):
-    should_quit = False
-    for file in files:
-      if file.endswith('.po'):
-        filepath = os.path.join(root, file)
-        count, should_quit = process_po_file(filepath, comparison_type, max_char_diff, no_comparison)
-        total_count += count
-        if should_quit:
-          break
-    if should_quit:
-      break
+  files = queue.Queue(maxsize=PREFETCH_FILES)
+  stop = threading.Event()
+  prefetcher = threading.Thread(target=prefetch_po_files, name='po-prefetch', daemon=True,
+                                args=(directory, comparison_type, max_char_diff, no_comparison, files, stop,
+                                      journal, work))
+  prefetcher.start()
+  writer = BackgroundWriter()
+  try:
+    while True:
+      item = files.get()
+      if item is None:
+        break
+      filepath, po, entries = item
+      count, should_quit = process_po_file(filepath, comparison_type, max_char_diff, no_comparison,
+                                            memory, po, entries, writer, journal)
+      total_count += count
+      if should_quit:
+        break
+  finally:
+    stop.set()
+    for filepath, error in writer.close():
+      print_info(f"Could not save {filepath}: {error}")
   print_info(f"Changes made: {total_count}")
 
 def should_edit_entry(entry, comparison_type, max_char_diff):
@@ -237,43 +379,14 @@ def should_edit_entry(entry, comparison_type, max_char_diff):
     return False
 
   if comparison_type == 'whitespace_punctuation':
-    return strings_differ_by_whitespace_and_punctuation(previous_msgid, msgid)
+    return differs_by_punctuation(previous_msgid, msgid)
   elif comparison_type == 'character_difference':
     return strings_differ_by_n_chars(previous_msgid, msgid, max_char_diff)
   return False
 
-def strings_differ_by_whitespace_and_punctuation(str1, str2):
-  """Check if two strings differ only by whitespace and punctuation."""
-  normalized_str1 = normalize_string(str1)
-  normalized_str2 = normalize_string(str2)
-
-  return normalized_str1 == normalized_str2
-
-def normalize_string(s):
-  """Normalize a string by lowercasing, removing punctuation, and normalizing whitespace."""
-  normalized = []
-  prev_char = None
-  punctuation = string.punctuation + "…"
-  for ch in s:
-    if ch in punctuation:
-      continue  # Skip punctuation
-    if ch.isspace():
-      # Only append a single space when encountering multiple spaces
-      if prev_char != ' ':
-        normalized.append(' ')
-      prev_char = ' '
-    else:
-      normalized.append(ch.lower())
-      prev_char = ch.lower()
-  return ''.join(normalized).strip()
-
 def strings_differ_by_n_chars(str1, str2, max_char_diff):
-  """Check if two strings differ by no more than N characters."""
-  # Use SequenceMatcher to compute the similarity ratio
-  matcher = SequenceMatcher(None, str1, str2)
-  # Get the number of character differences
-  diff_chars = int((1 - matcher.ratio()) * max(len(str1), len(str2)))
-  return diff_chars <= max_char_diff
+  """Check if two strings differ by no more than N characters (insertions, deletions or substitutions)."""
+  return bounded_edit_distance(str1, str2, max_char_diff) <= max_char_diff
 
 def parse_args():
   parser = argparse.ArgumentParser(description="An interactive editor for fuzzy translations.")
@@ -283,8 +396,34 @@ def parse_args():
   parser.add_argument('--max-char-diff', type=int, default=2,
                       help="The maximum number of character differences allowed (used only with 'character_difference').")
   parser.add_argument('--no-filter', action='store_true', help="Disable comparison checks and edit all fuzzy entries.")
+  parser.add_argument('--tm-db', help="Suggest translations from this l10n database (see create_l10n_db.py).")
+  parser.add_argument('--from-db', metavar='DB',
+                      help="Take the fuzzy entries from this l10n database instead of parsing every file.")
+  parser.add_argument('--project', help="With --from-db, only edit the entries of this project.")
+  parser.add_argument('--order', choices=ORDERS, default='project',
+                      help="With --from-db, edit by project and file, or the smallest msgid changes first.")
+  parser.add_argument('--session-file', default='.fuzzy_editor_session.jsonl',
+                      help="Journal of the session's progress, used by --resume.")
+  parser.add_argument('--resume', action='store_true',
+                      help="Continue the last session, leaving out finished files and skipped entries.")
+  add_profiling_arguments(parser)
   return parser.parse_args()
 
 if __name__ == "__main__":
   args = parse_args()
-  scan_directory(args.directory, args.filter_type, args.max_char_diff, args.no_filter)
+  if (args.project or args.order != 'project') and not args.from_db:
+    sys.exit("--project and --order need --from-db")
+  memory = None
+  if args.tm_db:
+    print_info("Loading the translation memory...")
+    memory = TranslationMemory.from_database(args.tm_db)
+  work = None
+  if args.from_db:
+    work = fuzzy_work(args.from_db, args.directory, args.project, args.order)
+  options = {'filter_type': args.filter_type, 'max_char_diff': args.max_char_diff, 'no_filter': args.no_filter}
+  journal = SessionJournal(args.session_file, options, args.resume)
+  try:
+    run_profiled(args, scan_directory, args.directory, args.filter_type, args.max_char_diff, args.no_filter,
+                 memory, journal, work)
+  finally:
+    journal.close()
@@ -0,0 +1,94 @@
+import os
+import sqlite3
+from edit_distance import bounded_edit_distance
+
+# Work queue of the fuzzy entries recorded in the l10n database
+# (create_l10n_db.py), so the editor and the repair tool only open the files
+# that have something to do instead of parsing the whole tree. The database
+# keeps the project (the directory holding the file) and the file name, files
+# are found again as directory/project/filename. Files changed since the
+# import are still opened, but all their fuzzy entries are taken, as the
+# recorded ones may be out of date.
+
+# Served by idx_fuzzy_obsolete (idx_entries_fuzzy_obsolete in normalized databases)
+FUZZY_QUERY = '''
+SELECT project, filename, msgctxt, msgid, previous_msgid, linenum
+FROM translations WHERE fuzzy = 1 AND obsolete = 0
+'''
+
+ORDERS = ['project', 'distance']
+
+# Edit distances above this all rank as one large change, which keeps the bounded search cheap
+MAX_RANKED_DISTANCE = 100
+
+def entry_distance(msgid, previous_msgid):
+  """
+  The edit distance between an entry's msgid and its previous one, MAX_RANKED_DISTANCE + 1 if it
+  is larger or there is no previous msgid.
+  """
+  if previous_msgid is None:
+    return MAX_RANKED_DISTANCE + 1
+  return bounded_edit_distance(previous_msgid, msgid, MAX_RANKED_DISTANCE)
+
+def is_current(record, filepath):
+  """Check whether the file still has the (mtime, size) it was imported with."""
+  if record is None:
+    return False
+  stat = os.stat(filepath)
+  return record == (stat.st_mtime_ns, stat.st_size)
+
+def fuzzy_work(db_path, directory, project=None, order='project'):
+  """
+  Return the [(filepath, keys)] of the files under directory with fuzzy entries according to the
+  database. `keys` lists the (msgctxt, msgid) of the entries to work on in order, or is None when
+  the file changed since the import. With `order` 'project' files come by project and name and
+  entries by line, with 'distance' the smallest changes of the msgids come first.
+  """
+  query = FUZZY_QUERY
+  params = ()
+  if project is not None:
+    query += " AND project = ?"
+    params = (project,)
+  conn = sqlite3.connect(db_path)
+  try:
+    rows = conn.execute(query, params).fetchall()
+    imported = {(row[0], row[1]): (row[2], row[3])
+                for row in conn.execute("SELECT project, filename, mtime, size FROM files")}
+  finally:
+    conn.close()
+
+  files = {}
+  for project_name, filename, msgctxt, msgid, previous_msgid, linenum in rows:
+    if order == 'distance':
+      rank = entry_distance(msgid, previous_msgid)
+    else:
+      rank = linenum
+    files.setdefault((project_name, filename), []).append((rank, msgctxt, msgid))
+
+  work = []
+  missing = 0
+  changed = 0
+  for key, entries in files.items():
+    filepath = os.path.join(directory, *key)
+    if not os.path.exists(filepath):
+      missing += 1
+      continue
+    entries.sort(key=lambda entry: entry[0])
+    keys = [(msgctxt, msgid) for _, msgctxt, msgid in entries]
+    if not is_current(imported.get(key), filepath):
+      changed += 1
+      keys = None
+    work.append(((entries[0][0], key) if order == 'distance' else key, filepath, keys))
+  work.sort(key=lambda item: item[0])
+  if missing > 0:
+    print(f"{missing} files of the database were not found under {directory}.")
+  if changed > 0:
+    print(f"{changed} files changed since the import, all their fuzzy entries are taken.")
+  return [(filepath, keys) for _, filepath, keys in work]
+
+def select_queued(entries, keys):
+  """Keep the entries listed in `keys`, in that order. All of them when `keys` is None."""
+  if keys is None:
+    return entries
+  by_key = {(entry.msgctxt, entry.msgid): entry for entry in entries}
+  return [by_key[key] for key in keys if key in by_key]
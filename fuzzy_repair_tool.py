@@ -1,8 +1,24 @@
 import random
 import os
+import io
+import sys
 # import string
 import polib
 import argparse
+import locale_packs
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+from scan_cache import ScanCache
+from po_writer import save_changed_entries
+from change_plan import PlanWriter, change_record, apply_plan
+from fuzzy_queue import fuzzy_work
+from po_prefilter import has_fuzzy_entries
+from change_classifier import REPAIRABLE_KINDS, classify_changes, is_repairable
+from profiling import STATS, add_profiling_arguments, run_profiled
+from rule_engine import Rule, RuleSet, SuffixMatcher, first_alpha_index
+from accelerators import (count_unescaped_ampersands, remove_unescaped_ampersand, assign_ampersand_randomly,
+                          accelerator_letters, sibling_accelerators, file_seed, DEFAULT_MODEL_PATH)
+from locale_packs import pack_for, use_model
 from termcolor import colored
 from difflib import SequenceMatcher
 
@@ -20,198 +36,94 @@ from difflib import SequenceMatcher
 # msgid "Directory:" msgid "Directory:"
 # msgstr "κατάλογος" msgstr "κατάλογος:"
 
-# Letter Frequencies of the Greek language
-GREEK_LETTER_PENALTIES = {
-  'α': 10.81, 'τ': 7.99, 'ο': 7.23, 'ε': 7.18, 'σ': 7.00, 'ι': 6.64,
-  'ν': 6.19, 'ρ': 4.32, 'π': 4.15, 'κ': 3.77, 'μ': 3.43, 'η': 3.18,
-  'υ': 3.04, 'λ': 2.66, 'γ': 1.70, 'δ': 1.63, 'χ': 1.29, 'ω': 1.23,
-  'θ': 1.22, 'φ': 0.74, 'β': 0.67, 'ξ': 0.44, 'ζ': 0.33, 'ψ': 0.15
-}
-
-# List of Greek letters to exclude
-EXCLUDED_LETTERS = {'ά', 'έ', 'ή', 'ί', 'ό', 'ύ', 'ώ', 'ϊ', 'ϋ', 'ΐ', 'ΰ', 'ς'}
-
-def detect_ampersand_changes(old_msgid, new_msgid):
+class AmpersandRule(Rule):
   """
-  Detect if an ampersand (&) has been added or removed between old_msgid and new_msgid.
-  Ignore escaped ampersands (&&).
+  Follow accelerator changes: if ampersands were removed, remove them from msgstr, if they
+  were added, assign them randomly to letters of msgstr. Escaped ampersands (&&) are ignored.
   """
-  # Count non-escaped ampersands (&) by removing '&&' and counting remaining '&'
-  old_ampersands = old_msgid.count('&') - old_msgid.count('&&') * 2
-  new_ampersands = new_msgid.count('&') - new_msgid.count('&&') * 2
-
-  return old_ampersands, new_ampersands
+  name = 'ampersand'
+
+  def analyze(self, old_msgid, new_msgid):
+    old_ampersands = count_unescaped_ampersands(old_msgid)
+    new_ampersands = count_unescaped_ampersands(new_msgid)
+    if new_ampersands != old_ampersands or new_ampersands > 0:
+      # A moved ampersand leaves msgstr as is
+      return new_ampersands - old_ampersands
+    return None
 
-def remove_unescaped_ampersand(msgstr, count_to_remove):
-  """
-  Remove only unescaped ampersands (&) from the string, leaving escaped ampersands (&&) intact.
-  `count_to_remove` specifies how many ampersands to remove.
-  """
-  result = []
-  i = 0
-  ampersands_removed = 0
-  while i < len(msgstr):
-    # Check for escaped ampersands (&&)
-    if msgstr[i:i+2] == '&&':
-      result.append('&&')
-      i += 2  # Skip both '&'
-    elif msgstr[i] == '&' and ampersands_removed < count_to_remove:
-      # Remove the unescaped ampersand
-      ampersands_removed += 1
-      i += 1  # Skip this '&'
-    else:
-      result.append(msgstr[i])
-      i += 1
-  return ''.join(result)
+  def apply(self, added, msgstr, context):
+    if added > 0:
+      # Prefer letters that entries with the same msgctxt do not use
+      return assign_ampersand_randomly(msgstr, added, context['locale'], context.get('avoid', ()))
+    if added < 0:
+      return remove_unescaped_ampersand(msgstr, -added)
+    return msgstr
 
-def apply_ampersand_change(old_msgid, new_msgid, msgstr):
-  """
-  Apply the ampersand change to msgstr. If ampersand was removed, remove it from msgstr.
-  If ampersand was added, assign it randomly to a letter in msgstr.
+class TrailingRule(Rule):
   """
-  old_ampersands, new_ampersands = detect_ampersand_changes(old_msgid, new_msgid)
-
-  if new_ampersands > old_ampersands:
-    # Ampersand added, assign it randomly
-    ampersands_to_add = new_ampersands - old_ampersands
-    return (True, assign_ampersand_randomly(msgstr, ampersands_to_add))
-  elif old_ampersands > new_ampersands:
-    # Ampersand removed, remove from msgstr
-    return (True, remove_unescaped_ampersand(msgstr, old_ampersands - new_ampersands))
-  elif new_ampersands > 0:
-    # Ampersand's location moved.
-    return (True, msgstr)
-  return (False, msgstr)
-
-def assign_ampersand_randomly(msgstr, ampersands_to_add):
+  Follow the trailing punctuation like '...' that was added to or removed from msgid, written
+  the way the locale writes it.
   """
-  Assign ampersands randomly to letters in msgstr.
-  Penalize common Greek letters and exclude vowels with diacritics.
-  """
-  # Filter out excluded vowels and create a list of unique letters in the msgstr
-  unique_letters = [ch for ch in set(msgstr.lower()) if ch.isalpha() and ch not in EXCLUDED_LETTERS]
+  name = 'trailing'
 
-  if not unique_letters:
-    # No valid letters to assign ampersands, return unchanged msgstr
-    return msgstr
+  def __init__(self, patterns):
+    self.suffixes = SuffixMatcher(patterns)
 
-  # Create a list of letters with their penalties
-  letter_weights = []
-  for letter in unique_letters:
-    penalty = GREEK_LETTER_PENALTIES.get(letter, 1)  # Higher penalty for common letters
-    letter_weights.append(int(100 / penalty))  # More penalty = fewer chances
-
-  # Randomly assign ampersands to letters in msgstr
-  for _ in range(ampersands_to_add):
-    chosen_letter = random.choices(unique_letters, weights=letter_weights)[0]
-    msgstr = insert_ampersand_before_letter(msgstr, chosen_letter)
-  return msgstr
-
-def insert_ampersand_before_letter(msgstr, letter):
-  """Insert ampersand (&) before the first occurrence of the chosen letter (lowercase or uppercase) in msgstr."""
-  lower_letter = letter.lower()
-  upper_letter = letter.upper()
-
-  lower_index = msgstr.find(lower_letter)
-  upper_index = msgstr.find(upper_letter)
-
-  if lower_index == -1 and upper_index == -1:
-    return msgstr # cannot happen
-  elif lower_index == -1 or (upper_index != -1 and upper_index < lower_index):
-    return msgstr.replace(upper_letter, '&' + lower_letter, 1)
-  else:
-    return msgstr.replace(lower_letter, '&' + lower_letter, 1)
+  def analyze(self, old_msgid, new_msgid):
+    old_trailing = self.suffixes.match(old_msgid)
+    new_trailing = self.suffixes.match(new_msgid)
+    if old_trailing != new_trailing:
+      return old_trailing, new_trailing
+    return None
 
-def detect_trailing_changes(old, new):
-  """
-  Detect if certain trailing characters like '...' have been added or removed
-  between the old msgid and new msgid.
-  """
-  # Define the trailing patterns to look for
-  trailing_patterns = ['...', '…', ': ', ':', '.', ', ', ',']
+  def apply(self, trailing, msgstr, context):
+    old_trailing, new_trailing = (context['locale'].msgstr_suffix(suffix) if suffix else suffix
+                                  for suffix in trailing)
+    # Remove old trailing pattern from msgstr if it exists
+    if old_trailing and msgstr.endswith(old_trailing):
+      msgstr = msgstr[:-len(old_trailing)].rstrip()
+    # Add the new trailing pattern to msgstr if a new one exists
+    if new_trailing and not msgstr.endswith(new_trailing):
+      msgstr = msgstr.rstrip() + new_trailing
+    return msgstr
 
-  def find_trailing_pattern(s):
-    for pattern in trailing_patterns:
-      if s.endswith(pattern):
-        return pattern
+def sentence_case(s, capitalize=str.capitalize):
+  # Check if the first character is '&' or a non-alphabetic symbol
+  first_index = first_alpha_index(s)
+  if first_index == -1: return s
+  return s[:first_index] + capitalize(s[first_index:])
+
+class CaseRule(Rule):
+  """Follow msgid changes to sentence case or lowercase, with the case mappings of the locale."""
+  name = 'case'
+
+  def analyze(self, old_msgid, new_msgid):
+    # Check if new_str is the sentence-cased version of old_msgid
+    if sentence_case(old_msgid) == new_msgid:
+      return 'sentence'
+    first_index_new = first_alpha_index(new_msgid)
+    if first_index_new != -1 and new_msgid[first_index_new].islower():
+      return 'lower'
+    if old_msgid == sentence_case(new_msgid):
+      # Words titled cased, ignore.
+      return 'keep'
     return None
 
-  old_trailing = find_trailing_pattern(old)
-  new_trailing = find_trailing_pattern(new)
-
-  if old_trailing != new_trailing:
-    return old_trailing, new_trailing
-  return None, None
+  def apply(self, case, msgstr, context):
+    locale = context['locale']
+    if case == 'sentence':
+      return sentence_case(msgstr, locale.capitalize)
+    if case == 'lower' and locale.follow_lowercase:
+      return locale.lower(msgstr)
+    return msgstr
 
-def apply_trailing_change(old_msgid, new_msgid, msgstr):
-  """
-  Automatically apply trailing changes if the trailing pattern has been modified
-  between old_msgid and new_msgid.
-  """
-  old_trailing, new_trailing = detect_trailing_changes(old_msgid, new_msgid)
-  if old_trailing is None and new_trailing is None:
-    # No trailing changes detected
-    return (False, msgstr)
-  # Remove old trailing pattern from msgstr if it exists
-  if old_trailing and msgstr.endswith(old_trailing):
-    msgstr = msgstr[:-len(old_trailing)].rstrip()
-  # Add the new trailing pattern to msgstr if a new one exists
-  if new_trailing and not msgstr.endswith(new_trailing):
-    msgstr = msgstr.rstrip() + new_trailing
-  return (True, msgstr)
-
-def apply_case_change(old_msgid, new_msgid, msgstr):
-  def first_alpha_index(s):
-    # Find the first index of an alphabetic character
-    for i, ch in enumerate(s):
-      if ch.isalpha(): return i
-    return -1
-
-  def sentence_case(s):
-    # Check if the first character is '&' or a non-alphabetic symbol
-    first_index = first_alpha_index(s)
-    if first_index == -1: return s
-    return s[:first_index] + s[first_index:].capitalize()
-
-  # Check if new_str is the sentence-cased version of old_msgid
-  if sentence_case(old_msgid) == new_msgid:
-    # Apply the same sentence casing to msg
-    return (True, sentence_case(msgstr))
-  first_index_new = first_alpha_index(new_msgid)
-  if first_index_new != -1 and new_msgid[first_index_new].islower():
-    # Apply lowercase to all letters in msgstr
-    return (True, msgstr.lower())
-  if old_msgid == sentence_case(new_msgid):
-    # Words titled cased, ignore.
-    return (True, msgstr)
-  return (False, msgstr)
-
-def is_trivial_change(str1, str2):
-  """Check if two strings differ only by whitespace and punctuation."""
-  normalized_str1 = normalize_string(str1)
-  normalized_str2 = normalize_string(str2)
-
-  return normalized_str1 == normalized_str2
-
-def normalize_string(s):
-  """Normalize a string by lowercasing, removing punctuation, and normalizing whitespace."""
-  normalized = []
-  prev_char = None
-  # punctuation = string.punctuation + "…"
-  punctuation = '.&:,…'
-  for ch in s:
-    if ch in punctuation:
-      continue  # Skip punctuation
-    if ch.isspace():
-      # Only append a single space when encountering multiple spaces
-      if prev_char != ' ':
-        normalized.append(' ')
-      prev_char = ' '
-    else:
-      normalized.append(ch.lower())
-      prev_char = ch
-  return ''.join(normalized).strip()
+# The transforms applied to msgstr, in this order
+REPAIR_RULES = RuleSet()
+REPAIR_RULES.register(AmpersandRule())
+REPAIR_RULES.register(TrailingRule(['...', '…', ': ', ':', '.', ', ', ',']))
+REPAIR_RULES.register(CaseRule())
 
+@STATS.timed('diff-render')
 def colored_inline_diff(str1, str2):
   # Create a SequenceMatcher object
   matcher = SequenceMatcher(None, str1, str2)
@@ -260,10 +172,13 @@ def process_msgstr_change(current_msgstr, new_msgstr, change_applied):
   else:
     return MsgstrChangeStatus.UNCHANGED  # No changes applied
 
-def detect_and_preapply_changes(entry, filepath):
+def detect_and_preapply_changes(entry, filepath, locale, fired_rules=None, avoid=()):
   """
   Detect if the msgid or msgid_plural has added or removed trailing characters and apply the same change to msgstr_plural[0] (singular form)
   and msgstr_plural[1] (plural form). If the change is trivial (punctuation, case, etc.), pre-apply it automatically.
+  The msgstr is changed following the conventions of the `locale` pack. The names of the
+  changes that applied are added to the `fired_rules` list, if given, new accelerators avoid
+  the letters in `avoid` if possible.
   """
   old_msgid = entry.previous_msgid
   new_msgid = entry.msgid
@@ -272,19 +187,12 @@ def detect_and_preapply_changes(entry, filepath):
 
   # Helper function to apply changes to msgstr (both singular and plural)
   def apply_changes_to_strs(old, new, msgstr):
-    change_applied = False
-    applied, new_msgstr = apply_ampersand_change(old, new, msgstr)
-    change_applied = change_applied or applied
-    applied, new_msgstr = apply_trailing_change(old, new, new_msgstr)
-    change_applied = change_applied or applied
-    applied, new_msgstr = apply_case_change(old, new, new_msgstr)
-    change_applied = change_applied or applied
-    return change_applied, new_msgstr
+    return REPAIR_RULES.apply(REPAIR_RULES.analyze(old, new), msgstr, fired_rules, {'avoid': avoid, 'locale': locale})
 
   is_trivial_change_plural = bool(old_msgid_plural and new_msgid_plural) and \
-      is_trivial_change(old_msgid_plural, new_msgid_plural)
+      is_repairable(old_msgid_plural, new_msgid_plural)
   # Handle singular and plural together if both exist
-  if old_msgid and is_trivial_change(old_msgid, new_msgid) and \
+  if old_msgid and is_repairable(old_msgid, new_msgid) and \
       bool(entry.msgstr_plural) == is_trivial_change_plural: # XNOR
     print_header(f"Editing fuzzy entry in {filepath}:{entry.linenum}")
     print_subheader(f"Detected trivial change in msgid:")
@@ -353,10 +261,28 @@ def detect_and_preapply_changes(entry, filepath):
     # print_unchanged(f"No changes applied due to complexity.")
     return False  # Change is not trivial, skipping
 
-def process_po_file(filepath):
-  """Process the .po file and handle fuzzy entries."""
-  po = polib.pofile(filepath, encoding='utf-8', wrapwidth=80)
+def process_po_file(filepath, dry_run=False, seed=None):
+  """
+  Process the .po file and handle fuzzy entries. Returns the number of changes, the number of
+  fuzzy entries left and the change plan records. With `dry_run` nothing is saved, with a
+  `seed` the random choices are reproducible. Files without fuzzy entries are not parsed.
+  """
+  with STATS.phase('prefilter'):
+    candidate = has_fuzzy_entries(filepath)
+  if not candidate:
+    STATS.count('prefiltered')
+    return 0, 0, []
+  if seed is not None:
+    random.seed(seed)
+  with STATS.phase('parse'):
+    po = polib.pofile(filepath, encoding='utf-8', wrapwidth=80)
+  # The conventions of the file's language
+  locale = pack_for(po)
+  # Accelerators used by the entries of each msgctxt
+  used_accelerators = sibling_accelerators(po, locale.lower)
   count = 0
+  changed_entries = []
+  changes = []
 
   def mark_entry_as_translated(entry):
     entry.previous_msgctxt = None
@@ -364,28 +290,165 @@ def process_po_file(filepath):
     entry.previous_msgid_plural = None
     entry.flags.remove('fuzzy')  # Remove the fuzzy flag
 
-  for entry in po.fuzzy_entries():
-    if detect_and_preapply_changes(entry, filepath):
+  with STATS.phase('filter'):
+    fuzzy_entries = po.fuzzy_entries()
+    # First stage: leave the entries whose msgid changed beyond what the rules follow
+    kinds = classify_changes([(entry.previous_msgid, entry.msgid) for entry in fuzzy_entries])
+  STATS.count('fuzzy', len(fuzzy_entries))
+  for entry, kind in zip(fuzzy_entries, kinds):
+    if kind not in REPAIRABLE_KINDS:
+      continue
+    old_msgstr = entry.msgstr
+    old_msgstr_plural = entry.msgstr_plural.copy()
+    fired_rules = []
+    siblings = used_accelerators.setdefault(entry.msgctxt, set())
+    with STATS.phase('transform'):
+      changed = detect_and_preapply_changes(entry, filepath, locale, fired_rules,
+                                            siblings if entry.msgctxt is not None else ())
+    if changed:
+      siblings.update(accelerator_letters(entry.msgstr_plural[0] if entry.msgstr_plural else entry.msgstr,
+                                          locale.lower))
       count += 1
       mark_entry_as_translated(entry)
-  if count > 0:
+      changed_entries.append(entry)
+      changes.append(change_record('fuzzy_repair_tool', fired_rules or ['unfuzzy'], filepath, entry,
+                                   old_msgstr, old_msgstr_plural, mark_translated=True))
+  STATS.count('changes', count)
+  if count > 0 and not dry_run:
     print_info(f"Saving changes to {filepath}...")
-    po.save()
-  return count
+    save_changed_entries(po, changed_entries)
+  # Fuzzy entries left for manual review
+  fuzzy_count = len(po.fuzzy_entries())
+  return count, fuzzy_count, changes
 
-def scan_directory(directory):
-  """Scan the directory for .po files and process them."""
-  count = 0
+def find_po_files(directory):
+  """Yield the paths of all .po files under the directory."""
   for root, _, files in os.walk(directory):
     for file in files:
       if file.endswith('.po'):
-        filepath = os.path.join(root, file)
-        count += process_po_file(filepath)
-  print_info(f"Changes made: {count}")
+        yield os.path.join(root, file)
+
+def init_worker(force_color, collect_stats=False, model_weights=None):
+  """
+  Keep colored output in worker processes whose stdout is captured, collect their statistics
+  and draw accelerators with the accelerator models loaded by the parent.
+  """
+  if model_weights:
+    locale_packs.model_weights.update(model_weights)
+  if force_color:
+    os.environ['FORCE_COLOR'] = '1'
+  # Forked workers inherit the statistics the parent recorded so far, which it already counts
+  STATS.clear()
+  if collect_stats:
+    STATS.enable()
+  # Forked workers inherit the cProfile hook of --profile, which only covers the parent
+  sys.setprofile(None)
+
+def process_po_file_buffered(filepath, dry_run=False, seed=None):
+  """
+  Process the .po file, capturing its console output so it is printed in one piece.
+  Returns the result, the output and the statistics collected meanwhile (None if disabled).
+  """
+  buffer = io.StringIO()
+  with redirect_stdout(buffer), STATS.file(filepath):
+    result = process_po_file(filepath, dry_run, seed)
+  return result, buffer.getvalue(), STATS.take() if STATS.enabled else None
+
+def scan_directory(directory, jobs=1, cache=None, report=None, seed=None, work=None):
+  """
+  Scan the directory for .po files and process them, using `jobs` worker processes. With a
+  `work` queue (see fuzzy_queue.py) only its files are processed instead of the whole tree.
+  Files recorded as unchanged in the `cache` manifest are skipped. With a `report` PlanWriter
+  this is a dry run: the changes are written to the plan instead of the files. With a `seed`,
+  each file gets its own seed derived from it, so runs give the same result whatever the jobs.
+  """
+  dry_run = report is not None
+  filepaths = []
+  skipped = 0
+  with STATS.phase('walk'):
+    candidates = list(find_po_files(directory)) if work is None else [filepath for filepath, _ in work]
+  for filepath in candidates:
+    with STATS.phase('cache'):
+      unchanged = cache and cache.lookup(filepath) is not None
+    if unchanged:
+      skipped += 1
+    else:
+      filepaths.append(filepath)
+  seeds = [None if seed is None else file_seed(seed, os.path.relpath(filepath, directory))
+           for filepath in filepaths]
+
+  def record(filepath, result):
+    count, fuzzy_count, changes = result
+    if dry_run:
+      report.write(changes)
+    elif cache:
+      cache.record(filepath, {'fuzzy': fuzzy_count, 'changes': count})
+    return count
+
+  count = 0
+  if jobs > 1:
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(
+        sys.stdout.isatty(), STATS.enabled, locale_packs.model_weights)) as executor:
+      # Results come back in walk order, each file's report as a single block
+      for filepath, (result, output, stats) in zip(filepaths, executor.map(
+          process_po_file_buffered, filepaths, [dry_run] * len(filepaths), seeds, chunksize=4)):
+        print(output, end='')
+        if stats is not None:
+          STATS.merge(stats)
+        count += record(filepath, result)
+  else:
+    for filepath, file_seed_value in zip(filepaths, seeds):
+      with STATS.file(filepath):
+        result = process_po_file(filepath, dry_run, file_seed_value)
+      count += record(filepath, result)
+  if skipped > 0:
+    print_info(f"Skipped {skipped} unchanged files.")
+  if dry_run:
+    print_info(f"Changes planned: {count}, written to {report.path}")
+  else:
+    print_info(f"Changes made: {count}")
 
 if __name__ == "__main__":
   parser = argparse.ArgumentParser(description="An automatic tool to repair fuzzy translations.")
-  parser.add_argument("directory", help="The directory to scan for .po files.")
+  parser.add_argument("directory", nargs="?", help="The directory to scan for .po files.")
+  parser.add_argument("--jobs", "-j", type=int, default=1,
+                      help="Number of worker processes, each handling whole files (default: 1).")
+  parser.add_argument("--cache-file", default=".fuzzy_repair_cache.json",
+                      help="Manifest used to skip files unchanged since the last run.")
+  parser.add_argument("--force", action="store_true",
+                      help="Ignore the manifest and process every file.")
+  parser.add_argument("--dry-run", action="store_true",
+                      help="Write the changes to the --report plan instead of the files.")
+  parser.add_argument("--report", help="The JSON Lines change plan written by --dry-run.")
+  parser.add_argument("--apply", metavar="PLAN", help="Apply a change plan written by --dry-run and exit.")
+  parser.add_argument("--seed", type=int, help="Seed the accelerator choices, so that runs give identical diffs.")
+  parser.add_argument("--from-db", metavar="DB",
+                      help="Only open the files with fuzzy entries according to this l10n database.")
+  parser.add_argument("--project", help="With --from-db, only repair the files of this project.")
+  parser.add_argument("--accelerator-model", default=DEFAULT_MODEL_PATH,
+                      help="The accelerator weights built by accelerator_model.py, used if the file exists.")
+  add_profiling_arguments(parser)
   args = parser.parse_args()
 
-  scan_directory(args.directory)
+  if args.apply:
+    applied, stale = apply_plan(args.apply)
+    print_info(f"Changes applied: {applied}, stale: {stale}")
+    sys.exit(0)
+  if args.directory is None:
+    parser.error("the directory is required unless --apply is given")
+  if args.dry_run != bool(args.report):
+    parser.error("--dry-run and --report go together")
+  if args.project and not args.from_db:
+    parser.error("--project needs --from-db")
+
+  if os.path.exists(args.accelerator_model):
+    use_model(args.accelerator_model)
+  cache = ScanCache(args.cache_file, args.force)
+  report = PlanWriter(args.report) if args.dry_run else None
+  try:
+    work = fuzzy_work(args.from_db, args.directory, args.project) if args.from_db else None
+    run_profiled(args, scan_directory, args.directory, args.jobs, cache, report, args.seed, work)
+  finally:
+    cache.save()
+    if report:
+      report.close()
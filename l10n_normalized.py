@@ -0,0 +1,226 @@
+# Normalized schema for the l10n database. Strings are interned in their own
+# tables, projects and files are dimension tables and occurrences get a row
+# each. A `translations` view with the original column names keeps existing
+# queries working, deletes go through it with an INSTEAD OF trigger.
+
+# Interned string tables and the columns of `entries` that point into them
+STRING_TABLES = {
+  'msgids': ('msgid_id', 'msgid_plural_id', 'previous_msgid_id', 'previous_msgid_plural_id'),
+  'msgstrs': ('msgstr_id', 'msgstr_plural_id'),
+  'contexts': ('msgctxt_id', 'previous_msgctxt_id')
+}
+
+# Indexes built by create_normalized_indexes
+normalized_index_names = ['idx_entries_catalog', 'idx_entries_msgid', 'idx_entries_translated',
+                          'idx_entries_fuzzy_obsolete', 'idx_entries_untranslated',
+                          'idx_occurrences_entry']
+
+def is_normalized(conn):
+  """
+  Checks whether the database uses the normalized schema.
+  """
+  cursor = conn.cursor()
+  cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entries'")
+  return cursor.fetchone() is not None
+
+def create_normalized_database(conn):
+  """
+  Creates the normalized tables and the `translations` compatibility view.
+  """
+  cursor = conn.cursor()
+  for table in STRING_TABLES:
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, text TEXT UNIQUE)")
+  cursor.execute("CREATE TABLE IF NOT EXISTS sources (id INTEGER PRIMARY KEY, path TEXT UNIQUE)")
+  cursor.execute("CREATE TABLE IF NOT EXISTS projects (id INTEGER PRIMARY KEY, name TEXT UNIQUE)")
+  cursor.execute('''
+  CREATE TABLE IF NOT EXISTS catalogs (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER REFERENCES projects(id),
+    filename TEXT,
+    UNIQUE (project_id, filename)
+  )
+  ''')
+  cursor.execute('''
+  CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    catalog_id INTEGER REFERENCES catalogs(id),
+    msgid_id INTEGER REFERENCES msgids(id),
+    msgstr_id INTEGER REFERENCES msgstrs(id),
+    msgid_plural_id INTEGER REFERENCES msgids(id),
+    msgstr_plural_id INTEGER REFERENCES msgstrs(id),
+    msgctxt_id INTEGER REFERENCES contexts(id),
+    previous_msgctxt_id INTEGER REFERENCES contexts(id),
+    previous_msgid_id INTEGER REFERENCES msgids(id),
+    previous_msgid_plural_id INTEGER REFERENCES msgids(id),
+    linenum INTEGER,
+    approved BOOLEAN,
+    fuzzy BOOLEAN,
+    obsolete BOOLEAN
+  )
+  ''')
+  cursor.execute('''
+  CREATE TABLE IF NOT EXISTS occurrences (
+    entry_id INTEGER REFERENCES entries(id),
+    position INTEGER,
+    source_id INTEGER REFERENCES sources(id),
+    line TEXT
+  )
+  ''')
+  cursor.execute('''
+  CREATE VIEW IF NOT EXISTS translations AS
+  SELECT
+    e.id AS id,
+    p.name AS project,
+    c.filename AS filename,
+    mi.text AS msgid,
+    ms.text AS msgstr,
+    mp.text AS msgid_plural,
+    mx.text AS msgstr_plural,
+    ct.text AS msgctxt,
+    coalesce((SELECT group_concat(occurrence, ',') FROM (
+      SELECT s.path || ':' || o.line AS occurrence
+      FROM occurrences o JOIN sources s ON s.id = o.source_id
+      WHERE o.entry_id = e.id ORDER BY o.position)), '') AS occurrences,
+    pc.text AS previous_msgctxt,
+    pm.text AS previous_msgid,
+    pp.text AS previous_msgid_plural,
+    e.linenum AS linenum,
+    e.approved AS approved,
+    e.fuzzy AS fuzzy,
+    e.obsolete AS obsolete
+  FROM entries e
+  JOIN catalogs c ON c.id = e.catalog_id
+  JOIN projects p ON p.id = c.project_id
+  LEFT JOIN msgids mi ON mi.id = e.msgid_id
+  LEFT JOIN msgstrs ms ON ms.id = e.msgstr_id
+  LEFT JOIN msgids mp ON mp.id = e.msgid_plural_id
+  LEFT JOIN msgstrs mx ON mx.id = e.msgstr_plural_id
+  LEFT JOIN contexts ct ON ct.id = e.msgctxt_id
+  LEFT JOIN contexts pc ON pc.id = e.previous_msgctxt_id
+  LEFT JOIN msgids pm ON pm.id = e.previous_msgid_id
+  LEFT JOIN msgids pp ON pp.id = e.previous_msgid_plural_id
+  ''')
+  cursor.execute('''
+  CREATE TRIGGER IF NOT EXISTS translations_delete INSTEAD OF DELETE ON translations
+  BEGIN
+    DELETE FROM occurrences WHERE entry_id = OLD.id;
+    DELETE FROM entries WHERE id = OLD.id;
+  END
+  ''')
+  conn.commit()
+
+def create_normalized_indexes(conn):
+  """
+  Creates the indexes of the normalized tables, matching the ones of the flat schema.
+  """
+  cursor = conn.cursor()
+  cursor.execute("CREATE INDEX IF NOT EXISTS idx_entries_catalog ON entries(catalog_id)")
+  cursor.execute("CREATE INDEX IF NOT EXISTS idx_entries_msgid ON entries(msgid_id)")
+  cursor.execute("CREATE INDEX IF NOT EXISTS idx_entries_translated ON entries(approved)")
+  cursor.execute("CREATE INDEX IF NOT EXISTS idx_entries_fuzzy_obsolete ON entries(fuzzy, obsolete)")
+  cursor.execute("CREATE INDEX IF NOT EXISTS idx_entries_untranslated ON entries(approved, fuzzy, obsolete)")
+  cursor.execute("CREATE INDEX IF NOT EXISTS idx_occurrences_entry ON occurrences(entry_id)")
+  conn.commit()
+
+def prune_strings(conn):
+  """
+  Deletes interned strings and sources no longer referenced by any entry.
+  """
+  cursor = conn.cursor()
+  for table, columns in STRING_TABLES.items():
+    used = ' UNION '.join(f"SELECT {column} FROM entries WHERE {column} IS NOT NULL" for column in columns)
+    cursor.execute(f"DELETE FROM {table} WHERE id NOT IN ({used})")
+  cursor.execute("DELETE FROM sources WHERE id NOT IN (SELECT source_id FROM occurrences)")
+  conn.commit()
+
+class Interner:
+  """Maps strings to ids of an interned table, adding the missing ones in batches."""
+
+  def __init__(self, cursor, table, column='text'):
+    self.table = table
+    self.column = column
+    cursor.execute(f"SELECT id, {column} FROM {table}")
+    self.ids = {text: row_id for row_id, text in cursor}
+    self.next_id = max(self.ids.values(), default=0) + 1
+    self.pending = []
+
+  def __call__(self, text):
+    if text is None:
+      return None
+    row_id = self.ids.get(text)
+    if row_id is None:
+      row_id = self.ids[text] = self.next_id
+      self.next_id += 1
+      self.pending.append((row_id, text))
+    return row_id
+
+  def flush(self, cursor):
+    if self.pending:
+      cursor.executemany(f"INSERT INTO {self.table} (id, {self.column}) VALUES (?, ?)", self.pending)
+      self.pending = []
+
+class NormalizedWriter:
+  """Inserts rows in the layout of the flat translations table into the normalized tables."""
+
+  def __init__(self, conn):
+    self.cursor = conn.cursor()
+    self.msgids = Interner(self.cursor, 'msgids')
+    self.msgstrs = Interner(self.cursor, 'msgstrs')
+    self.contexts = Interner(self.cursor, 'contexts')
+    self.sources = Interner(self.cursor, 'sources', 'path')
+    self.projects = Interner(self.cursor, 'projects', 'name')
+    self.cursor.execute("SELECT id, project_id, filename FROM catalogs")
+    self.catalogs = {(project_id, filename): row_id for row_id, project_id, filename in self.cursor}
+    self.cursor.execute("SELECT coalesce(max(id), 0) FROM entries")
+    self.next_entry_id = self.cursor.fetchone()[0] + 1
+
+  def catalog_id(self, project, filename):
+    project_id = self.projects(project)
+    key = (project_id, filename)
+    row_id = self.catalogs.get(key)
+    if row_id is None:
+      self.projects.flush(self.cursor)
+      self.cursor.execute("INSERT INTO catalogs (project_id, filename) VALUES (?, ?)", key)
+      row_id = self.catalogs[key] = self.cursor.lastrowid
+    return row_id
+
+  def insert(self, rows):
+    entries = []
+    occurrences = []
+    for (project, filename, msgid, msgstr, msgid_plural, msgstr_plural, msgctxt, occurrence_list,
+         previous_msgctxt, previous_msgid, previous_msgid_plural, linenum,
+         approved, fuzzy, obsolete) in rows:
+      entry_id = self.next_entry_id
+      self.next_entry_id += 1
+      entries.append((
+        entry_id,
+        self.catalog_id(project, filename),
+        self.msgids(msgid),
+        self.msgstrs(msgstr),
+        self.msgids(msgid_plural),
+        self.msgstrs(msgstr_plural),
+        self.contexts(msgctxt),
+        self.contexts(previous_msgctxt),
+        self.msgids(previous_msgid),
+        self.msgids(previous_msgid_plural),
+        linenum,
+        approved,
+        fuzzy,
+        obsolete
+      ))
+      if occurrence_list:
+        for position, occurrence in enumerate(occurrence_list.split(',')):
+          source_file, _, line = occurrence.rpartition(':')
+          occurrences.append((entry_id, position, self.sources(source_file), line))
+    for interner in (self.msgids, self.msgstrs, self.contexts, self.sources):
+      interner.flush(self.cursor)
+    self.cursor.executemany('''
+    INSERT INTO entries (
+      id, catalog_id, msgid_id, msgstr_id, msgid_plural_id, msgstr_plural_id,
+      msgctxt_id, previous_msgctxt_id, previous_msgid_id, previous_msgid_plural_id,
+      linenum, approved, fuzzy, obsolete
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', entries)
+    self.cursor.executemany("INSERT INTO occurrences (entry_id, position, source_id, line) VALUES (?, ?, ?, ?)",
+                            occurrences)
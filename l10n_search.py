@@ -0,0 +1,95 @@
+import sqlite3
+import argparse
+from termcolor import colored
+from create_l10n_db import database_path, has_search_index, create_search_index
+
+# Full-text search over msgid/msgstr of the l10n database, answered from the
+# translations_fts trigram index (see create_search_index) instead of a
+# LIKE '%...%' table scan.
+
+# Trigram matching needs at least this many characters
+MIN_QUERY_LENGTH = 3
+
+def fts_phrase(text):
+  """Quote text as a single FTS5 phrase."""
+  return '"' + text.replace('"', '""') + '"'
+
+def search_translations(conn, text, field=None, approved_only=False, limit=20):
+  """
+  Return up to `limit` distinct (msgid, msgstr, count) tuples where `field` (msgid, msgstr or
+  both when None) contains `text`, best matches first.
+  """
+  approved = "AND t.approved" if approved_only else ""
+  cursor = conn.cursor()
+  if len(text) >= MIN_QUERY_LENGTH:
+    query = fts_phrase(text)
+    if field is not None:
+      query = f"{field} : {query}"
+    cursor.execute(f'''
+    SELECT t.msgid, t.msgstr, count(*) AS uses
+    FROM translations_fts f JOIN translations t ON t.id = f.rowid
+    WHERE translations_fts MATCH ? {approved}
+    GROUP BY t.msgid, t.msgstr
+    ORDER BY min(f.rank), uses DESC
+    LIMIT ?
+    ''', (query, limit))
+  else:
+    # Too short for trigrams, fall back to a scan
+    pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    columns = [field] if field else ['msgid', 'msgstr']
+    condition = ' OR '.join(f"t.{column} LIKE ? ESCAPE '\\'" for column in columns)
+    cursor.execute(f'''
+    SELECT t.msgid, t.msgstr, count(*) AS uses
+    FROM translations t
+    WHERE ({condition}) {approved}
+    GROUP BY t.msgid, t.msgstr
+    ORDER BY uses DESC
+    LIMIT ?
+    ''', (*[pattern] * len(columns), limit))
+  return cursor.fetchall()
+
+def highlight(text, term):
+  """Color the occurrences of term in text."""
+  if not term:
+    return text
+  lower_text = text.lower()
+  lower_term = term.lower()
+  parts = []
+  position = 0
+  index = lower_text.find(lower_term)
+  while index != -1:
+    parts.append(text[position:index])
+    parts.append(colored(text[index:index + len(term)], 'green', attrs=['bold']))
+    position = index + len(term)
+    index = lower_text.find(lower_term, position)
+  parts.append(text[position:])
+  return ''.join(parts)
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="Look up how a term was translated before.")
+  parser.add_argument('term', help="The text to search for.")
+  parser.add_argument('--db', default=database_path, help="The l10n database to search.")
+  parser.add_argument('--field', choices=['msgid', 'msgstr'], help="Only search this field.")
+  parser.add_argument('--approved', action='store_true', help="Only show approved translations.")
+  parser.add_argument('--limit', type=int, default=20, help="The maximum number of results.")
+  return parser.parse_args()
+
+def main():
+  args = parse_args()
+  conn = sqlite3.connect(args.db)
+  try:
+    if not has_search_index(conn):
+      print("Building the search index...")
+      create_search_index(conn)
+    results = search_translations(conn, args.term, args.field, args.approved, args.limit)
+  finally:
+    conn.close()
+  for msgid, msgstr, uses in results:
+    print(highlight(msgid, args.term))
+    print(colored("  ↳ ", "cyan") + highlight(msgstr or '', args.term) +
+          colored(f"  ({uses})", "dark_grey"))
+  if not results:
+    print("No matches.")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,106 @@
+import os
+import json
+from functools import lru_cache
+from accelerators import AcceleratorWeights
+
+# Locale packs: what the tools need to know about the language of a catalog.
+# The letter frequencies that weigh new accelerators, the letters that must
+# not take one, how trailing msgid punctuation is written in msgstr, special
+# case mappings, whether msgstr follows a msgid change to lowercase, and the
+# letters on the editor's E/W/S keys in the locale's keyboard layout.
+#
+# Packs are the JSON files of locales/, named after the language code. The
+# language of a catalog comes from the Language: field of its header, so one
+# run over a tree of many languages picks the right pack for every file. A
+# pack is loaded the first time a file of its language comes up and then
+# cached for the rest of the process. Language codes fall back from el_GR or
+# sr@latin to el and sr, and languages without a pack get default.json.
+
+LOCALES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'locales')
+GENERIC_PACK = 'default'
+
+# The language of catalogs without a Language header, the tools started out Greek-only
+FALLBACK_LANGUAGE = 'el'
+
+# Weights built by accelerator_model.py, by language, used instead of the pack's letter frequencies
+model_weights = {}
+
+class LocalePack:
+  """The conventions of one language, as read from its pack file."""
+
+  def __init__(self, language, name=None, letter_frequencies=None, excluded_letters=(), trailing=None,
+               lowercase=None, uppercase=None, follow_lowercase=True, action_keys=None):
+    self.language = language
+    self.name = name or language
+    # More frequent letters get fewer chances, other letters get the weight of frequency 1
+    self.letter_weights = {letter: int(100 / frequency) for letter, frequency in (letter_frequencies or {}).items()}
+    self.excluded_letters = frozenset(excluded_letters)
+    self.trailing = trailing or {}
+    self.lowercase_table = str.maketrans(lowercase) if lowercase else None
+    self.uppercase_table = str.maketrans(uppercase) if uppercase else None
+    self.follow_lowercase = follow_lowercase
+    self.action_keys = action_keys or {}
+    self.pack_weights = AcceleratorWeights(self.letter_weights)
+
+  @property
+  def weights(self):
+    """The AcceleratorWeights of new accelerators: the model of the language if one was loaded."""
+    return model_weights.get(self.language, self.pack_weights)
+
+  def msgstr_suffix(self, suffix):
+    """How a trailing msgid suffix (':', '...') is written at the end of msgstr."""
+    return self.trailing.get(suffix, suffix)
+
+  def lower(self, s):
+    if self.lowercase_table:
+      s = s.translate(self.lowercase_table)
+    return s.lower()
+
+  def capitalize(self, s):
+    if not self.lowercase_table and not self.uppercase_table:
+      return s.capitalize()
+    first = s[:1].translate(self.uppercase_table) if self.uppercase_table else s[:1]
+    return first.upper() + self.lower(s[1:])
+
+  def action(self, key):
+    """Map a key typed in the editor to its Latin letter (e, w or s) on the same keyboard key."""
+    return self.action_keys.get(key, key)
+
+def language_codes(language):
+  """The codes to look for a pack under, most specific first: sr_RS@latin, sr_RS, sr."""
+  language = language.replace('-', '_')
+  codes = [language]
+  for separator in ('@', '_'):
+    base = codes[-1].split(separator)[0]
+    if base not in codes:
+      codes.append(base)
+  return codes
+
+@lru_cache(maxsize=None)
+def load_pack(language):
+  """Return the LocalePack of a language, reading its file once per process."""
+  codes = language_codes(language)
+  for code in codes + [GENERIC_PACK]:
+    path = os.path.join(LOCALES_DIRECTORY, f"{code}.json")
+    if os.path.exists(path):
+      with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+      # A language without a pack keeps its own code, so a model can still be loaded for it
+      return LocalePack(codes[-1] if code == GENERIC_PACK else code, **data)
+  return LocalePack(codes[-1])
+
+def language_of(po):
+  """The language code of a polib catalog, from its header."""
+  return po.metadata.get('Language', '').strip() or FALLBACK_LANGUAGE
+
+def pack_for(po):
+  return load_pack(language_of(po))
+
+def use_model(path):
+  """Draw the accelerators of the model's language with the weights of an accelerator_model.py file."""
+  weights = AcceleratorWeights.load(path)
+  # Models without a language were built from the Greek database
+  if weights.language is None:
+    weights.language = FALLBACK_LANGUAGE
+  model_weights[weights.language] = weights
+  return weights
@@ -0,0 +1,144 @@
+import os
+import random
+import argparse
+import polib
+
+# Seeded generator of synthetic translation trees in the layout of the KDE
+# l10n repository, messages/<project>/<catalog>.po, for benchmarking the
+# tools at scale. Entries are built from a small English-Greek vocabulary
+# and include what the tools look for: fuzzy entries with a previous msgid
+# (trailing punctuation, case, accelerator and wording changes), plurals,
+# contexts, keyboard accelerators and misplaced ones before accented letters.
+
+VOCABULARY = [
+  ('file', 'αρχείο'), ('open', 'άνοιγμα'), ('save', 'αποθήκευση'), ('close', 'κλείσιμο'),
+  ('folder', 'φάκελος'), ('settings', 'ρυθμίσεις'), ('network', 'δίκτυο'), ('connection', 'σύνδεση'),
+  ('document', 'έγγραφο'), ('window', 'παράθυρο'), ('selected', 'επιλεγμένα'), ('items', 'αντικείμενα'),
+  ('configure', 'διαμόρφωση'), ('display', 'οθόνη'), ('new', 'νέο'), ('delete', 'διαγραφή'),
+  ('copy', 'αντιγραφή'), ('paste', 'επικόλληση'), ('print', 'εκτύπωση'), ('search', 'αναζήτηση'),
+  ('replace', 'αντικατάσταση'), ('view', 'προβολή'), ('tools', 'εργαλεία'), ('help', 'βοήθεια'),
+  ('account', 'λογαριασμός'), ('password', 'κωδικός'), ('server', 'διακομιστής'), ('address', 'διεύθυνση'),
+  ('message', 'μήνυμα'), ('image', 'εικόνα'), ('color', 'χρώμα'), ('size', 'μέγεθος'),
+  ('could not', 'αδυναμία'), ('load', 'φόρτωση'), ('the', 'το'), ('of', 'του'),
+  ('default', 'προεπιλογή'), ('application', 'εφαρμογή'), ('device', 'συσκευή'), ('sound', 'ήχος')
+]
+
+CONTEXTS = [None, None, None, '@action:button', '@action:inmenu', '@title:window', '@label',
+            '@info', '@info:tooltip', '@option:check', '@item:inlistbox']
+
+PROJECTS = ['dolphin', 'kate', 'konsole', 'okular', 'gwenview', 'kmail', 'plasma-desktop', 'kdenlive',
+            'krita', 'ktorrent', 'elisa', 'spectacle', 'ark', 'kcalc', 'kontact', 'digikam']
+
+HEADER = {
+  'Project-Id-Version': 'synthetic',
+  'Language': 'el',
+  'MIME-Version': '1.0',
+  'Content-Type': 'text/plain; charset=UTF-8',
+  'Content-Transfer-Encoding': '8bit',
+  'Plural-Forms': 'nplurals=2; plural=n != 1;'
+}
+
+# Share of the entries of each kind
+FUZZY_RATIO = 0.15
+PLURAL_RATIO = 0.05
+ACCELERATOR_RATIO = 0.3
+INVALID_ACCELERATOR_RATIO = 0.02
+UNTRANSLATED_RATIO = 0.05
+
+def add_accelerator(text, rng, letters=None):
+  """Put a & before a random letter of text, one of `letters` when given."""
+  positions = [i for i, ch in enumerate(text) if ch.isalpha() and (letters is None or ch in letters)]
+  if not positions:
+    return text
+  position = rng.choice(positions)
+  return text[:position] + '&' + text[position:]
+
+def make_phrase(rng):
+  """Return a random (msgid, msgstr) pair."""
+  words = rng.choices(VOCABULARY, k=rng.randint(1, 10))
+  msgid = ' '.join(english for english, _ in words).capitalize()
+  msgstr = ' '.join(greek for _, greek in words).capitalize()
+  return msgid, msgstr
+
+def previous_version(msgid, rng):
+  """Return an older version of msgid, differing in the way fuzzy entries usually do."""
+  change = rng.choice(['trailing', 'case', 'accelerator', 'wording', 'whitespace'])
+  if change == 'trailing':
+    return msgid + rng.choice([':', '…', '.', '...'])
+  if change == 'case':
+    return msgid.lower() if msgid[:1].isupper() else msgid.capitalize()
+  if change == 'accelerator':
+    return msgid.replace('&', '') if '&' in msgid else add_accelerator(msgid, rng)
+  if change == 'whitespace':
+    return msgid.replace(' ', '  ', 1)
+  english, _ = rng.choice(VOCABULARY)
+  return f"{msgid} {english}"
+
+def make_entry(rng, number):
+  """Return a random polib.POEntry."""
+  msgid, msgstr = make_phrase(rng)
+  if rng.random() < ACCELERATOR_RATIO:
+    msgid = add_accelerator(msgid, rng)
+    msgstr = add_accelerator(msgstr, rng)
+  elif rng.random() < INVALID_ACCELERATOR_RATIO:
+    msgid = add_accelerator(msgid, rng)
+    msgstr = add_accelerator(msgstr, rng, 'άέήίόύώ')
+  entry = polib.POEntry(
+    msgid=msgid,
+    msgctxt=rng.choice(CONTEXTS),
+    occurrences=[(f"src/{rng.choice(['main', 'view', 'dialog', 'settings'])}.cpp", str(number))]
+  )
+  if rng.random() < PLURAL_RATIO:
+    entry.msgid = f"%1 {msgid.lower()}"
+    entry.msgid_plural = f"%1 {msgid.lower()}s"
+    entry.msgstr_plural = {0: f"%1 {msgstr.lower()}", 1: f"%1 {msgstr.lower()}"}
+  elif rng.random() >= UNTRANSLATED_RATIO:
+    entry.msgstr = msgstr
+  if (entry.msgstr or entry.msgstr_plural) and rng.random() < FUZZY_RATIO:
+    entry.flags.append('fuzzy')
+    entry.previous_msgctxt = entry.msgctxt
+    entry.previous_msgid = previous_version(entry.msgid, rng)
+    if entry.msgid_plural:
+      entry.previous_msgid_plural = previous_version(entry.msgid_plural, rng)
+  return entry
+
+def generate_corpus(directory, projects=8, files_per_project=10, entries_per_file=200, seed=0):
+  """
+  Write a tree of projects x files_per_project .po files under directory, the same for the
+  same arguments. Returns the paths of the written files.
+  """
+  rng = random.Random(seed)
+  paths = []
+  for project_number in range(projects):
+    project = PROJECTS[project_number % len(PROJECTS)]
+    if project_number >= len(PROJECTS):
+      project = f"{project}{project_number // len(PROJECTS)}"
+    os.makedirs(os.path.join(directory, project), exist_ok=True)
+    for file_number in range(files_per_project):
+      po = polib.POFile(wrapwidth=80)
+      po.header = (f"Greek translation of {project}.\n"
+                   f"This file is distributed under the same license as the {project} package.")
+      po.metadata = HEADER
+      po.append(polib.POEntry(msgctxt='NAME OF TRANSLATORS', msgid='Your names', msgstr='Ονόματα'))
+      # Entry counts vary around the average like real catalogs do
+      count = max(1, int(rng.expovariate(1 / entries_per_file)))
+      for number in range(count):
+        po.append(make_entry(rng, number + 1))
+      path = os.path.join(directory, project, f"{project}_{file_number}.po")
+      po.save(path)
+      paths.append(path)
+  return paths
+
+def main():
+  parser = argparse.ArgumentParser(description="Generate a synthetic tree of .po files for benchmarks.")
+  parser.add_argument('directory', help="Where to write the messages/<project>/*.po tree.")
+  parser.add_argument('--projects', type=int, default=8, help="The number of projects.")
+  parser.add_argument('--files', type=int, default=10, help="The number of .po files per project.")
+  parser.add_argument('--entries', type=int, default=200, help="The average number of entries per file.")
+  parser.add_argument('--seed', type=int, default=0, help="The random seed.")
+  args = parser.parse_args()
+  paths = generate_corpus(args.directory, args.projects, args.files, args.entries, args.seed)
+  print(f"Wrote {len(paths)} files to {args.directory}.")
+
+if __name__ == "__main__":
+  main()
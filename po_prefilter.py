@@ -0,0 +1,123 @@
+import os
+import re
+import mmap
+import time
+import argparse
+from functools import lru_cache
+from locale_packs import FALLBACK_LANGUAGE, load_pack
+
+# Byte-level pre-scan of .po files, run before the full parse. Most catalogs
+# of a stable tree have no fuzzy entries, and no accelerator on a letter that
+# their language excludes, and a regex search over the memory-mapped bytes
+# rules that out far faster than polib can parse the file. The checks only
+# answer "maybe" or "no": a file that passes is parsed as before, so a false
+# positive (a fuzzy header, an escaped &&) costs a parse, never an entry.
+# Strings wrapped over several lines are matched across the line breaks.
+
+LANGUAGE_HEADER = re.compile(rb'^"Language: *([^\\"\n]*)', re.MULTILINE)
+
+# How far into the file the header is looked for
+HEADER_BYTES = 8192
+
+AMPERSAND = ord('&')
+
+class MappedFile:
+  """Context manager giving the bytes of a file, memory-mapped read-only."""
+
+  def __init__(self, filepath):
+    self.filepath = filepath
+    self.map = None
+
+  def __enter__(self):
+    with open(self.filepath, 'rb') as f:
+      if os.fstat(f.fileno()).st_size == 0:
+        return b''
+      self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return self.map
+
+  def __exit__(self, *exc):
+    if self.map is not None:
+      self.map.close()
+
+def has_fuzzy_entries(filepath):
+  """
+  Check if the .po file may have fuzzy entries, without parsing it: if 'fuzzy' appears on a flags
+  comment line (#, ...) of a current entry, obsolete ones start with #~.
+  """
+  with MappedFile(filepath) as data:
+    position = data.find(b'fuzzy')
+    while position != -1:
+      start = data.rfind(b'\n', 0, position) + 1
+      if data[start:start + 2] == b'#,':
+        return True
+      position = data.find(b'fuzzy', position + 5)
+  return False
+
+def header_language(data):
+  """The Language: of the header in the raw bytes of a .po file, like locale_packs.language_of()."""
+  match = LANGUAGE_HEADER.search(data, 0, HEADER_BYTES)
+  language = match.group(1).decode('utf-8', 'replace').strip() if match else ''
+  return language or FALLBACK_LANGUAGE
+
+@lru_cache(maxsize=None)
+def excluded_accelerator_pattern(language):
+  """
+  A regex for an '&' before one of the excluded letters of the language, in either case, also
+  across the line break of a wrapped string, or None if the language excludes none.
+  """
+  letters = set()
+  for letter in load_pack(language).excluded_letters:
+    letters.add(letter)
+    upper = letter.upper()
+    if len(upper) == 1 and upper.lower() == letter:
+      letters.add(upper)
+  if not letters:
+    return None
+  # A literal '&' first lets the regex engine skip ahead to the ampersands, the letter may start
+  # the next line of a wrapped msgstr
+  return re.compile(b'&(?:"\r?\n")?(?:' +
+                    b'|'.join(re.escape(letter.encode('utf-8')) for letter in sorted(letters)) + b')')
+
+def is_unescaped(data, position):
+  """Check if the '&' at `position` is not the second half of an escaped &&."""
+  start = position
+  while start > 0 and data[start - 1] == AMPERSAND:
+    start -= 1
+  return (position - start) % 2 == 0
+
+def in_singular_msgstr(data, position):
+  """Check if `position` is on the line of a msgstr "..." or one of its continuation lines."""
+  start = data.rfind(b'\n', 0, position) + 1
+  while start > 0 and data[start:start + 1] == b'"':
+    start = data.rfind(b'\n', 0, start - 1) + 1
+  return data[start:start + 8] == b'msgstr "'
+
+def has_excluded_accelerators(filepath):
+  """
+  Check if the .po file may have accelerators on letters its language excludes, without parsing
+  it. Only singular msgstrs count, as fix_keybindings leaves plural ones alone.
+  """
+  with MappedFile(filepath) as data:
+    pattern = excluded_accelerator_pattern(header_language(data))
+    if pattern is None:
+      return False
+    for match in pattern.finditer(data):
+      if is_unescaped(data, match.start()) and in_singular_msgstr(data, match.start()):
+        return True
+  return False
+
+def main():
+  parser = argparse.ArgumentParser(description="Count the .po files the pre-filter lets through to a full parse.")
+  parser.add_argument('directory', help="The directory to scan for .po files.")
+  args = parser.parse_args()
+
+  filepaths = [os.path.join(root, name) for root, _, names in os.walk(args.directory)
+               for name in names if name.endswith('.po')]
+  for name, check in (('fuzzy', has_fuzzy_entries), ('excluded accelerators', has_excluded_accelerators)):
+    start = time.perf_counter()
+    passed = sum(1 for filepath in filepaths if check(filepath))
+    elapsed = time.perf_counter() - start
+    print(f"{name:22} {passed:6} of {len(filepaths)} files to parse ({elapsed:.3f}s)")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,244 @@
+import os
+import re
+import sys
+import codecs
+import argparse
+
+# Streaming, read-only .po parser. It yields one lightweight record per entry
+# instead of building a full polib.POFile, for the code paths that only read.
+# The fields follow polib's parsing rules, so the records compare equal to the
+# POEntry objects polib would produce for the same file.
+
+UNESCAPE_RE = re.compile(r'\\(\\|n|t|r|v|b|f|")')
+UNESCAPED_QUOTE_RE = re.compile(r'([^\\]|^)"')
+UNESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'v': '\v', 'b': '\b', 'f': '\f', '\\': '\\', '"': '"'}
+
+KEYWORDS = {'msgctxt': 'ct', 'msgid': 'mi', 'msgstr': 'ms', 'msgid_plural': 'mp'}
+PREVIOUS_KEYWORDS = {'msgctxt': 'pc', 'msgid': 'pm', 'msgid_plural': 'pp'}
+
+# Fields set by a single-line keyword
+SINGLE_FIELDS = {
+  'ct': 'msgctxt',
+  'mp': 'msgid_plural',
+  'pc': 'previous_msgctxt',
+  'pm': 'previous_msgid',
+  'pp': 'previous_msgid_plural'
+}
+
+# Fields extended by continuation lines, by state (msgstr[N] is handled apart)
+CONTINUED_FIELDS = dict(SINGLE_FIELDS, mi='msgid', ms='msgstr')
+
+# States after which any line other than a continuation starts a new entry
+ENTRY_END_STATES = ('ms', 'mx')
+
+def unescape(s):
+  if '\\' not in s:
+    return s
+  return UNESCAPE_RE.sub(lambda m: UNESCAPES[m.group(1)], s)
+
+class PoEntryRecord:
+  """A read-only .po entry with the fields of polib.POEntry that the tools use."""
+  __slots__ = ('msgid', 'msgstr', 'msgid_plural', 'msgstr_plural', 'msgctxt',
+               'previous_msgctxt', 'previous_msgid', 'previous_msgid_plural',
+               'flags', 'occurrences', 'linenum', 'obsolete')
+
+  def __init__(self, linenum):
+    self.msgid = ''
+    self.msgstr = ''
+    self.msgid_plural = ''
+    self.msgstr_plural = {}
+    self.msgctxt = None
+    self.previous_msgctxt = None
+    self.previous_msgid = None
+    self.previous_msgid_plural = None
+    self.flags = []
+    self.occurrences = []
+    self.linenum = linenum
+    self.obsolete = False
+
+  @property
+  def fuzzy(self):
+    return 'fuzzy' in self.flags
+
+  def __repr__(self):
+    return f"<PoEntryRecord {self.linenum}: {self.msgid!r}>"
+
+def syntax_error(filepath, linenum, detail=''):
+  return IOError(f"Syntax error in po file {filepath} (line {linenum}){detail}")
+
+def iter_po_entries(filepath, encoding='utf-8'):
+  """
+  Parse the .po file lazily and yield a PoEntryRecord for each entry, skipping the header.
+  Raises IOError on syntax errors, like polib.
+  """
+  entry = PoEntryRecord(0)
+  state = 'st'
+  plural_index = 0
+  header_seen = False
+  last_token = None
+  symbol = value = None
+
+  def finish(entry):
+    # polib removes the first msgid "" entry without context as the header
+    nonlocal header_seen
+    if not header_seen and entry.msgid == '' and not entry.obsolete and not entry.msgctxt:
+      header_seen = True
+      return None
+    return entry
+
+  with open(filepath, encoding=encoding) as f:
+    for linenum, line in enumerate(f, 1):
+      if linenum == 1 and line.startswith(codecs.BOM_UTF8.decode('utf-8')):
+        line = line[1:]
+      line = line.strip()
+      if not line:
+        continue
+      tokens = line.split(None, 2)
+      keyword = last_token = tokens[0]
+      if keyword == '#~|':
+        continue
+      obsolete = False
+      if keyword == '#~' and len(tokens) > 1:
+        line = line[3:].strip()
+        tokens = tokens[1:]
+        keyword = last_token = tokens[0]
+        obsolete = True
+
+      continuation = None
+      if keyword in KEYWORDS and len(tokens) > 1:
+        value = line[len(keyword):].lstrip()
+        if UNESCAPED_QUOTE_RE.search(value[1:-1]):
+          raise syntax_error(filepath, linenum, ": unescaped double quote found")
+        symbol = KEYWORDS[keyword]
+      elif keyword == '#:':
+        if len(tokens) <= 1:
+          continue
+        symbol = 'oc'
+      elif line[:1] == '"':
+        if UNESCAPED_QUOTE_RE.search(line[1:-1]):
+          raise syntax_error(filepath, linenum, ": unescaped double quote found")
+        continuation = line
+      elif line[:7] == 'msgstr[':
+        symbol = 'mx'
+        value = line
+      elif keyword == '#,':
+        if len(tokens) <= 1:
+          continue
+        symbol = 'fl'
+      elif keyword == '#' or keyword.startswith('##'):
+        symbol = 'tc'
+      elif keyword == '#.':
+        if len(tokens) <= 1:
+          continue
+        symbol = 'gc'
+      elif keyword == '#|':
+        if len(tokens) <= 1:
+          raise syntax_error(filepath, linenum)
+        value = line[2:].lstrip()
+        if tokens[1].startswith('"'):
+          continuation = value
+        elif len(tokens) == 2:
+          raise syntax_error(filepath, linenum, ": invalid continuation line")
+        elif tokens[1] not in PREVIOUS_KEYWORDS:
+          raise syntax_error(filepath, linenum, f": unknown keyword {tokens[1]}")
+        else:
+          symbol = PREVIOUS_KEYWORDS[tokens[1]]
+          value = value[len(tokens[1]):].lstrip()
+      else:
+        raise syntax_error(filepath, linenum)
+
+      if continuation is not None:
+        # Continuation lines extend the current field, the state does not change
+        token = unescape(continuation[1:-1])
+        if state == 'mx':
+          entry.msgstr_plural[plural_index] += token
+        elif state in CONTINUED_FIELDS:
+          field = CONTINUED_FIELDS[state]
+          setattr(entry, field, getattr(entry, field) + token)
+        else:
+          raise syntax_error(filepath, linenum)
+        continue
+
+      # Header comments before the first entry belong to the file
+      if symbol == 'tc' and state in ('st', 'he'):
+        state = 'he'
+        continue
+      if symbol not in ('mp', 'ms', 'mx') and state in ENTRY_END_STATES:
+        finished = finish(entry)
+        if finished is not None:
+          yield finished
+        entry = PoEntryRecord(linenum)
+
+      if symbol == 'oc':
+        for occurrence in line[3:].split():
+          source_file, separator, source_line = occurrence.rpartition(':')
+          if not separator or not source_line.isdigit():
+            source_file, source_line = occurrence, ''
+          entry.occurrences.append((source_file, source_line))
+      elif symbol == 'fl':
+        entry.flags += [flag.strip() for flag in line[3:].split(',')]
+      elif symbol == 'mi':
+        entry.obsolete = obsolete
+        entry.msgid = unescape(value[1:-1])
+      elif symbol == 'ms':
+        entry.msgstr = unescape(value[1:-1])
+      elif symbol == 'mx':
+        plural_index = int(value[7])
+        entry.msgstr_plural[plural_index] = unescape(value[value.find('"') + 1:-1])
+      elif symbol in SINGLE_FIELDS:
+        setattr(entry, SINGLE_FIELDS[symbol], unescape(value[1:-1]))
+      # Translator and generated comments are not kept
+      state = symbol
+
+  # Trailing comments do not make an entry
+  if last_token is not None and not last_token.startswith('#'):
+    finished = finish(entry)
+    if finished is not None:
+      yield finished
+
+# ----------------------------- Verification ----------------------------- #
+
+COMPARED_FIELDS = PoEntryRecord.__slots__
+
+def compare_with_polib(filepath):
+  """Return a list of differences between this reader and polib for the file."""
+  import polib
+  po = polib.pofile(filepath, encoding='utf-8')
+  expected = list(po)
+  actual = list(iter_po_entries(filepath))
+  differences = []
+  if len(expected) != len(actual):
+    differences.append(f"{len(actual)} entries, polib found {len(expected)}")
+  for ref, rec in zip(expected, actual):
+    for field in COMPARED_FIELDS:
+      ref_value, rec_value = getattr(ref, field), getattr(rec, field)
+      if ref_value != rec_value:
+        differences.append(f"line {ref.linenum}: {field} is {rec_value!r}, polib has {ref_value!r}")
+  return differences
+
+def main():
+  parser = argparse.ArgumentParser(description="Check the streaming .po reader against polib.")
+  parser.add_argument('directory', help="The directory with the .po files to compare.")
+  args = parser.parse_args()
+
+  checked = 0
+  failed = 0
+  for root, _, files in os.walk(args.directory):
+    for file in files:
+      if file.endswith('.po'):
+        filepath = os.path.join(root, file)
+        checked += 1
+        try:
+          differences = compare_with_polib(filepath)
+        except IOError as e:
+          differences = [str(e)]
+        if differences:
+          failed += 1
+          print(f"{filepath}:")
+          for difference in differences:
+            print(f"  {difference}")
+  print(f"Compared {checked} files, {failed} differ.")
+  return 1 if failed else 0
+
+if __name__ == "__main__":
+  sys.exit(main())
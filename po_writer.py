@@ -0,0 +1,103 @@
+import os
+import queue
+import tempfile
+import threading
+from profiling import STATS
+
+# Writes back only the entries of a polib.POFile that were changed, splicing
+# their new text into the original file instead of re-serializing the whole
+# catalog with po.save(). Everything outside the changed entries stays
+# byte-for-byte identical, including the wrapping of untouched entries.
+
+def entry_line_spans(po, entries, lines):
+  """
+  Map each entry to the (start, end) range of 0-based line indexes it occupies in the file.
+  An entry runs from its `linenum` up to the next entry, without the trailing blank lines
+  and comments that polib does not attach to it.
+  """
+  starts = sorted(entry.linenum for entry in po)
+  next_start = {start: end for start, end in zip(starts, starts[1:] + [len(lines) + 1])}
+  spans = []
+  for entry in entries:
+    start = entry.linenum - 1
+    end = next_start[entry.linenum] - 1
+    while end > start and (not lines[end - 1].strip() or lines[end - 1].lstrip().startswith(b'#')):
+      end -= 1
+    spans.append((start, end))
+  return spans
+
+def save_changed_entries(po, entries):
+  """
+  Save the changed `entries` of `po` by rewriting only their lines in the file, atomically.
+  Falls back to po.save() when an entry cannot be located in the original file.
+  """
+  entries = list(entries)
+  if not entries:
+    return
+  with STATS.phase('save'):
+    write_changed_entries(po, entries)
+
+def write_changed_entries(po, entries):
+  """Splice the entries into the file, see save_changed_entries."""
+  if any(entry.obsolete or entry.linenum < 1 for entry in entries):
+    po.save()
+    return
+
+  with open(po.fpath, 'rb') as f:
+    lines = f.read().splitlines(keepends=True)
+  spans = entry_line_spans(po, entries, lines)
+
+  chunks = []
+  position = 0
+  for entry, (start, end) in sorted(zip(entries, spans), key=lambda item: item[1]):
+    text = entry.__unicode__(po.wrapwidth)
+    # Keep the line endings of the original file
+    if lines[start].endswith(b'\r\n'):
+      text = text.replace('\n', '\r\n')
+    chunks.extend(lines[position:start])
+    chunks.append(text.encode(po.encoding))
+    position = end
+  chunks.extend(lines[position:])
+
+  directory = os.path.dirname(os.path.abspath(po.fpath))
+  fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.po.tmp')
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      f.writelines(chunks)
+    os.chmod(tmp_path, os.stat(po.fpath).st_mode & 0o7777)
+    os.replace(tmp_path, po.fpath)
+  except BaseException:
+    os.unlink(tmp_path)
+    raise
+
+class BackgroundWriter:
+  """Saves changed entries with save_changed_entries in a background thread, in submission order."""
+
+  def __init__(self):
+    self.queue = queue.Queue()
+    self.errors = []
+    self.thread = threading.Thread(target=self.run, name='po-writer', daemon=True)
+    self.thread.start()
+
+  def run(self):
+    while True:
+      item = self.queue.get()
+      if item is None:
+        return
+      po, entries, on_saved = item
+      try:
+        save_changed_entries(po, entries)
+        if on_saved is not None:
+          on_saved()
+      except Exception as e:
+        self.errors.append((po.fpath, e))
+
+  def submit(self, po, entries, on_saved=None):
+    """Queue the entries for saving, calling `on_saved` once they are written."""
+    self.queue.put((po, list(entries), on_saved))
+
+  def close(self):
+    """Wait for the pending saves, returning the [(path, exception)] of the failed ones."""
+    self.queue.put(None)
+    self.thread.join()
+    return self.errors
@@ -0,0 +1,201 @@
+import json
+import time
+import cProfile
+import threading
+import functools
+from collections import defaultdict, Counter
+from contextlib import nullcontext
+
+# Run statistics shared by the tools, for finding where a slow run spends its
+# time. Code is split into phases (walk, parse, filter, transform,
+# diff-render, save, db-insert, ...) timed with `with STATS.phase(name)` or,
+# for whole functions, the @STATS.timed(name) decorator. Each file is timed
+# with `with STATS.file(path)`, together with the counters recorded while it
+# is processed. Phase times are exclusive: a phase nested in another is not
+# counted twice. Until enable() is called, phase() and file() return a shared
+# no-op context, so the instrumentation costs next to nothing.
+#
+# --stats prints a summary at the end of the run, --stats-json saves it and
+# --profile runs the tool under cProfile, saving a pstats dump.
+
+NO_OP = nullcontext()
+
+# Slowest files kept in the summary
+SLOWEST_FILES = 10
+
+class Phase:
+  """Times a phase, without the time of the phases nested in it."""
+
+  def __init__(self, stats, name):
+    self.stats = stats
+    self.name = name
+
+  def __enter__(self):
+    stack = self.stats.stack()
+    stack.append(0.0)
+    self.start = time.perf_counter()
+
+  def __exit__(self, *exc):
+    elapsed = time.perf_counter() - self.start
+    stack = self.stats.stack()
+    nested = stack.pop()
+    if stack:
+      stack[-1] += elapsed
+    with self.stats.lock:
+      self.stats.phases[self.name] += elapsed - nested
+      self.stats.calls[self.name] += 1
+
+class FileTimer:
+  """Times the processing of a file and collects the counters recorded meanwhile."""
+
+  def __init__(self, stats, filepath):
+    self.stats = stats
+    self.filepath = filepath
+
+  def __enter__(self):
+    self.stats.local.counters = Counter()
+    self.start = time.perf_counter()
+
+  def __exit__(self, *exc):
+    elapsed = time.perf_counter() - self.start
+    counters = self.stats.local.counters
+    self.stats.local.counters = None
+    with self.stats.lock:
+      self.stats.files[self.filepath] = (self.stats.files.get(self.filepath, (0.0, None))[0] + elapsed,
+                                         dict(counters))
+
+class Stats:
+  """Phase timers, counters and per-file times of a run."""
+
+  def __init__(self):
+    self.enabled = False
+    self.lock = threading.Lock()
+    self.local = threading.local()
+    self.clear()
+
+  def clear(self):
+    self.phases = defaultdict(float)
+    self.calls = Counter()
+    self.counters = Counter()
+    self.files = {}
+
+  def enable(self):
+    self.enabled = True
+    self.start = time.perf_counter()
+
+  def stack(self):
+    try:
+      return self.local.stack
+    except AttributeError:
+      self.local.stack = []
+      return self.local.stack
+
+  def phase(self, name):
+    if not self.enabled:
+      return NO_OP
+    return Phase(self, name)
+
+  def timed(self, name):
+    """Decorator timing each call of a function as the phase `name`."""
+    def decorate(function):
+      @functools.wraps(function)
+      def wrapper(*args, **kwargs):
+        if not self.enabled:
+          return function(*args, **kwargs)
+        with Phase(self, name):
+          return function(*args, **kwargs)
+      return wrapper
+    return decorate
+
+  def file(self, filepath):
+    if not self.enabled:
+      return NO_OP
+    return FileTimer(self, filepath)
+
+  def count(self, name, n=1):
+    """Add n to a counter, both for the run and for the file being processed."""
+    if not self.enabled:
+      return
+    with self.lock:
+      self.counters[name] += n
+    counters = getattr(self.local, 'counters', None)
+    if counters is not None:
+      counters[name] += n
+
+  def snapshot(self):
+    """Return the statistics as a JSON-compatible dict."""
+    return {
+      'phases': {name: {'seconds': seconds, 'calls': self.calls[name]} for name, seconds in self.phases.items()},
+      'counters': dict(self.counters),
+      'files': {filepath: {'seconds': seconds, 'counters': counters}
+                for filepath, (seconds, counters) in self.files.items()}
+    }
+
+  def take(self):
+    """Return the snapshot and clear, used to hand the statistics of a worker process to the parent."""
+    snapshot = self.snapshot()
+    self.clear()
+    return snapshot
+
+  def merge(self, snapshot):
+    """Add a snapshot taken in another process."""
+    with self.lock:
+      for name, phase in snapshot['phases'].items():
+        self.phases[name] += phase['seconds']
+        self.calls[name] += phase['calls']
+      self.counters.update(snapshot['counters'])
+      for filepath, record in snapshot['files'].items():
+        self.files[filepath] = (record['seconds'], record['counters'])
+
+  def summary(self, top=SLOWEST_FILES):
+    """Print the phase timers, counters and the slowest files."""
+    total = time.perf_counter() - self.start
+    print(f"\n{'phase':14} {'seconds':>9} {'share':>6} {'calls':>8}")
+    for name, seconds in sorted(self.phases.items(), key=lambda item: -item[1]):
+      print(f"{name:14} {seconds:9.3f} {seconds / total:6.1%} {self.calls[name]:8}")
+    print(f"{'wall time':14} {total:9.3f}")
+    if self.counters:
+      print()
+      for name, value in sorted(self.counters.items()):
+        print(f"{name:14} {value:9}")
+    if self.files:
+      print(f"\nSlowest {min(top, len(self.files))} of {len(self.files)} files:")
+      slowest = sorted(self.files.items(), key=lambda item: -item[1][0])[:top]
+      for filepath, (seconds, counters) in slowest:
+        details = ', '.join(f"{name} {value}" for name, value in sorted(counters.items()))
+        print(f"{seconds:9.3f}  {filepath}" + (f"  ({details})" if details else ""))
+
+  def save(self, path):
+    snapshot = self.snapshot()
+    snapshot['wall_seconds'] = time.perf_counter() - self.start
+    with open(path, 'w', encoding='utf-8') as f:
+      json.dump(snapshot, f, indent=2, ensure_ascii=False)
+
+# The statistics of this process, shared by all modules
+STATS = Stats()
+
+def add_profiling_arguments(parser):
+  """Add the --stats, --stats-json and --profile options to an argparse parser."""
+  parser.add_argument('--stats', action='store_true',
+                      help="Time the phases of the run and print a summary with the slowest files.")
+  parser.add_argument('--stats-json', metavar='PATH', help="Also save the statistics to this JSON file.")
+  parser.add_argument('--profile', metavar='PATH', help="Run under cProfile and save a pstats dump to this file.")
+
+def run_profiled(args, function, *arguments):
+  """Call function(*arguments) with the statistics and profiler the options ask for."""
+  if args.stats or args.stats_json:
+    STATS.enable()
+  profiler = cProfile.Profile() if args.profile else None
+  try:
+    if profiler:
+      return profiler.runcall(function, *arguments)
+    return function(*arguments)
+  finally:
+    if profiler:
+      profiler.dump_stats(args.profile)
+      print(f"Profile saved to {args.profile} (see python -m pstats).")
+    if STATS.enabled:
+      if args.stats:
+        STATS.summary()
+      if args.stats_json:
+        STATS.save(args.stats_json)
@@ -0,0 +1,186 @@
+import os
+import sys
+import polib
+import argparse
+from termcolor import colored
+from po_writer import save_changed_entries
+from change_plan import PlanWriter, change_record, apply_plan
+from locale_packs import pack_for
+from accelerators import (accelerator_letters, candidate_positions, count_unescaped_ampersands,
+                          remove_unescaped_ampersand)
+
+# Catalog-wide accelerator conflict resolver. Entries shown together (same
+# msgctxt and same source file of their first occurrence) form a group, and
+# two entries of a group must not share an accelerator letter. Entries that
+# keep their letter are fixed first, then the others are matched to the
+# letters still free with augmenting paths (Kuhn's algorithm), so an entry is
+# only left without a letter when no assignment of the group could give it
+# one. Groups are independent and at most an alphabet wide, which keeps whole
+# catalogs fast.
+
+def print_header(text):
+  print(colored(f"\n=== {text} ===", "yellow", attrs=["bold"]))
+
+def print_info(text):
+  print(colored(f"{text}", "magenta", attrs=["bold"]))
+
+def print_change(text):
+  print(colored(f"  ↳ {text}", "green"))
+
+def print_unchanged(text):
+  print(colored(f"  ↳ {text}", "dark_grey"))
+
+def group_key(entry):
+  """The (source file, msgctxt) of the entries shown together with `entry`, None if unknown."""
+  source = entry.occurrences[0][0] if entry.occurrences else None
+  if source is None and entry.msgctxt is None:
+    return None
+  return source, entry.msgctxt
+
+def accelerator_groups(po):
+  """Map each group key to its translated entries that have exactly one accelerator."""
+  groups = {}
+  for entry in po.translated_entries():
+    if entry.msgstr_plural or count_unescaped_ampersands(entry.msgstr) != 1:
+      continue
+    key = group_key(entry)
+    if key is not None:
+      groups.setdefault(key, []).append(entry)
+  return groups
+
+def letter_preference(letter, weights):
+  """Sort key trying rare letters first, by the AcceleratorWeights of the language."""
+  return -weights.letters.get(letter, weights.default), letter
+
+def match_letters(candidates, taken):
+  """
+  Assign a distinct letter to as many of the entries as possible, given each entry's
+  `candidates` in order of preference and the letters already `taken`. Returns
+  {index: letter} for the entries that got one.
+  """
+  owner = {}
+
+  def augment(index, seen):
+    for letter in candidates[index]:
+      if letter in taken or letter in seen:
+        continue
+      seen.add(letter)
+      # Take a free letter, or move its owner to another one
+      if letter not in owner or augment(owner[letter], seen):
+        owner[letter] = index
+        return True
+    return False
+
+  for index in range(len(candidates)):
+    augment(index, set())
+  return {index: letter for letter, index in owner.items()}
+
+def resolve_group(entries, locale):
+  """
+  Resolve the conflicts of one group, with the letters of the `locale` pack. Returns ([(entry, new msgstr)], unresolved entries).
+  Of the entries sharing a letter the first one in the file keeps it.
+  """
+  keep = {}
+  movers = []
+  for entry in sorted(entries, key=lambda entry: entry.linenum):
+    letter = next(iter(accelerator_letters(entry.msgstr, locale.lower)), None)
+    if letter is None or letter in keep:
+      movers.append(entry)
+    else:
+      keep[letter] = entry
+  if not movers:
+    return [], []
+
+  plains = [remove_unescaped_ampersand(entry.msgstr, 1) for entry in movers]
+  positions = [candidate_positions(plain, locale) for plain in plains]
+  weights = locale.weights
+  candidates = [sorted(letter_positions, key=lambda letter: letter_preference(letter, weights))
+                for letter_positions in positions]
+  assigned = match_letters(candidates, set(keep))
+
+  changes = []
+  unresolved = []
+  for index, entry in enumerate(movers):
+    letter = assigned.get(index)
+    if letter is None:
+      unresolved.append(entry)
+      continue
+    position = positions[index][letter]
+    changes.append((entry, plains[index][:position] + '&' + plains[index][position:]))
+  return changes, unresolved
+
+def process_po_file(filepath, dry_run=False):
+  """
+  Resolve the accelerator conflicts of the .po file. Returns the number of changes, the number
+  of entries left in conflict and the change plan records. With `dry_run` nothing is saved.
+  """
+  po = polib.pofile(filepath, encoding='utf-8', wrapwidth=80)
+  locale = pack_for(po)
+  changed_entries = []
+  records = []
+  unresolved_count = 0
+  for (source, msgctxt), entries in accelerator_groups(po).items():
+    changes, unresolved = resolve_group(entries, locale)
+    if not changes and not unresolved:
+      continue
+    print_header(f"Accelerator conflicts in {filepath} ({msgctxt or 'no context'}, {source or 'no source'})")
+    for entry, new_msgstr in changes:
+      print_change(f"{entry.linenum}: {entry.msgstr} → {new_msgstr}")
+      old_msgstr = entry.msgstr
+      entry.msgstr = new_msgstr
+      changed_entries.append(entry)
+      records.append(change_record('resolve_accelerators', ['accelerator_conflict'], filepath, entry,
+                                   old_msgstr, entry.msgstr_plural))
+    for entry in unresolved:
+      print_unchanged(f"{entry.linenum}: {entry.msgstr} (no free letter left)")
+    unresolved_count += len(unresolved)
+  if changed_entries and not dry_run:
+    print_info(f"Saving changes to {filepath}...")
+    save_changed_entries(po, changed_entries)
+  return len(changed_entries), unresolved_count, records
+
+def scan_directory(directory, report=None):
+  """
+  Resolve the accelerator conflicts of every .po file under directory. With a `report`
+  PlanWriter this is a dry run: the changes are written to the plan instead of the files.
+  """
+  count = 0
+  unresolved = 0
+  for root, _, files in os.walk(directory):
+    for file in files:
+      if file.endswith('.po'):
+        file_count, file_unresolved, records = process_po_file(os.path.join(root, file), report is not None)
+        if report:
+          report.write(records)
+        count += file_count
+        unresolved += file_unresolved
+  if report:
+    print_info(f"Changes planned: {count}, written to {report.path}")
+  else:
+    print_info(f"Changes made: {count}")
+  if unresolved > 0:
+    print_info(f"Entries left in conflict: {unresolved}")
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Resolve accelerator conflicts between entries shown together.")
+  parser.add_argument("directory", nargs="?", help="The directory to scan for .po files.")
+  parser.add_argument("--dry-run", action="store_true",
+                      help="Write the changes to the --report plan instead of the files.")
+  parser.add_argument("--report", help="The JSON Lines change plan written by --dry-run.")
+  parser.add_argument("--apply", metavar="PLAN", help="Apply a change plan written by --dry-run and exit.")
+  args = parser.parse_args()
+
+  if args.apply:
+    applied, stale = apply_plan(args.apply)
+    print_info(f"Changes applied: {applied}, stale: {stale}")
+    sys.exit(0)
+  if args.directory is None:
+    parser.error("the directory is required unless --apply is given")
+  if args.dry_run != bool(args.report):
+    parser.error("--dry-run and --report go together")
+  report = PlanWriter(args.report) if args.dry_run else None
+  try:
+    scan_directory(args.directory, report)
+  finally:
+    if report:
+      report.close()
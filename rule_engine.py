@@ -0,0 +1,78 @@
+import re
+
+# Registry of the transforms the repair tool applies to a msgstr when its
+# msgid changed trivially. A rule looks at an (old msgid, new msgid) pair once
+# and either declines or returns what it found; the findings of all rules
+# are then applied to the msgstr in registration order. Pattern data is
+# declared with the rule and compiled when it is created, so adding a rule
+# (say, one for a single language) only means registering it.
+
+class Rule:
+  """
+  A repair transform. `analyze` returns None when the rule does not apply to the msgid pair,
+  otherwise data that `apply` uses to transform the msgstr. `context` is a dict with whatever
+  the caller knows about the entry.
+  """
+  name = None
+
+  def analyze(self, old_msgid, new_msgid):
+    return None
+
+  def apply(self, data, msgstr, context):
+    return msgstr
+
+class RuleSet:
+  """Rules run in the order they were registered."""
+
+  def __init__(self):
+    self.rules = []
+
+  def register(self, rule):
+    self.rules.append(rule)
+    return rule
+
+  def analyze(self, old_msgid, new_msgid):
+    """Return the [(rule, data)] of the rules that apply to the msgid pair."""
+    findings = []
+    for rule in self.rules:
+      data = rule.analyze(old_msgid, new_msgid)
+      if data is not None:
+        findings.append((rule, data))
+    return findings
+
+  def apply(self, findings, msgstr, fired_rules=None, context=None):
+    """
+    Apply the findings of `analyze` to msgstr, returning (whether any rule applied, new msgstr).
+    The names of the rules are added to the `fired_rules` list, if given.
+    """
+    if context is None:
+      context = {}
+    for rule, data in findings:
+      msgstr = rule.apply(data, msgstr, context)
+      if fired_rules is not None and rule.name not in fired_rules:
+        fired_rules.append(rule.name)
+    return bool(findings), msgstr
+
+class SuffixMatcher:
+  """Finds which of a set of suffixes a string ends with, using one compiled regex."""
+
+  def __init__(self, suffixes):
+    # The longest suffix wins, as '...' must not be taken for '.'
+    ordered = sorted(suffixes, key=len, reverse=True)
+    self.pattern = re.compile('(?:' + '|'.join(map(re.escape, ordered)) + r')\Z')
+    self.longest = len(ordered[0])
+
+  def match(self, s):
+    """Return the suffix s ends with, or None."""
+    match = self.pattern.search(s, max(0, len(s) - self.longest))
+    return match.group() if match else None
+
+# The first letter of a string; digits and '_' are word characters but not letters
+FIRST_LETTER = re.compile(r'[^\W\d_]')
+
+def first_alpha_index(s):
+  """Return the index of the first alphabetic character of s, or -1."""
+  match = FIRST_LETTER.search(s)
+  while match and not match.group().isalpha():
+    match = FIRST_LETTER.search(s, match.end())
+  return match.start() if match else -1
@@ -0,0 +1,74 @@
+import os
+import json
+import hashlib
+
+# Persistent manifest of already scanned .po files. Each file is recorded with
+# its mtime, size and content hash together with the result of the last run,
+# so that re-runs over an unchanged tree can skip parsing it entirely.
+
+def file_digest(filepath):
+  """Return the SHA-1 hex digest of the file contents."""
+  digest = hashlib.sha1()
+  with open(filepath, 'rb') as f:
+    for chunk in iter(lambda: f.read(1 << 16), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+class ScanCache:
+  """Manifest mapping .po file paths to their stat, hash and last result."""
+
+  def __init__(self, path, force=False):
+    self.path = path
+    self.entries = {} if force else self.load()
+    self.dirty = False
+
+  def load(self):
+    try:
+      with open(self.path, encoding='utf-8') as f:
+        return json.load(f)
+    except (OSError, ValueError):
+      return {}
+
+  def lookup(self, filepath):
+    """
+    Return the recorded result if the file is unchanged since it was recorded, None otherwise.
+    The content hash is only computed when the mtime changed but the size did not.
+    """
+    record = self.entries.get(os.path.abspath(filepath))
+    if record is None:
+      return None
+    stat = os.stat(filepath)
+    if stat.st_size != record['size']:
+      return None
+    if stat.st_mtime_ns != record['mtime']:
+      if file_digest(filepath) != record['hash']:
+        return None
+      # Touched but identical (e.g. by a checkout), remember the new mtime
+      record['mtime'] = stat.st_mtime_ns
+      self.dirty = True
+    return record['result']
+
+  def record(self, filepath, result):
+    """Record the current state of the file together with the result of processing it."""
+    stat = os.stat(filepath)
+    self.entries[os.path.abspath(filepath)] = {
+      'mtime': stat.st_mtime_ns,
+      'size': stat.st_size,
+      'hash': file_digest(filepath),
+      'result': result
+    }
+    self.dirty = True
+
+  def forget(self, filepath):
+    if self.entries.pop(os.path.abspath(filepath), None) is not None:
+      self.dirty = True
+
+  def save(self):
+    """Write the manifest atomically, if anything changed."""
+    if not self.dirty:
+      return
+    tmp_path = f"{self.path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+      json.dump(self.entries, f)
+    os.replace(tmp_path, self.path)
+    self.dirty = False
@@ -0,0 +1,82 @@
+import os
+import json
+import hashlib
+import threading
+
+# Append-only journal of an editor session, so that an interrupted session
+# can be resumed where it stopped. It records the entries the user skipped
+# and the files that were finished, one JSON object per line, flushed as
+# they happen. A finished file is only passed over while its size and mtime
+# are those it had when it was finished, and only by sessions with the same
+# filter options.
+
+def entry_key(entry):
+  """Identify an entry of a file by its msgctxt and msgid."""
+  text = f"{entry.msgctxt or ''}\x04{entry.msgid}"
+  return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+class SessionJournal:
+  """Progress of the editor over a tree, shared by the editor, prefetch and writer threads."""
+
+  def __init__(self, path, options, resume=False):
+    self.path = path
+    self.options = options
+    self.done = {}
+    self.skipped = {}
+    if resume:
+      self.load()
+    self.lock = threading.Lock()
+    self.file = open(path, 'a' if resume else 'w', encoding='utf-8')
+    self.write({'type': 'session', 'options': options})
+
+  def load(self):
+    try:
+      with open(self.path, encoding='utf-8') as f:
+        lines = f.readlines()
+    except OSError:
+      return
+    same_options = False
+    for line in lines:
+      try:
+        record = json.loads(line)
+      except ValueError:
+        # The last line of a killed session may be cut short
+        continue
+      kind = record.get('type')
+      if kind == 'session':
+        same_options = record.get('options') == self.options
+      elif kind == 'skip':
+        self.skipped.setdefault(record['file'], set()).add(record['key'])
+      elif kind == 'done' and same_options:
+        self.done[record['file']] = (record['mtime'], record['size'])
+
+  def write(self, record):
+    with self.lock:
+      # The prefetch thread may still be running when the editor quits
+      if self.file.closed:
+        return
+      self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+      self.file.flush()
+
+  def is_done(self, filepath):
+    """Check whether the file was finished and has not changed since."""
+    signature = self.done.get(os.path.abspath(filepath))
+    if signature is None:
+      return False
+    stat = os.stat(filepath)
+    return signature == (stat.st_mtime_ns, stat.st_size)
+
+  def is_skipped(self, filepath, entry):
+    return entry_key(entry) in self.skipped.get(os.path.abspath(filepath), ())
+
+  def record_skip(self, filepath, entry):
+    self.write({'type': 'skip', 'file': os.path.abspath(filepath), 'key': entry_key(entry)})
+
+  def record_done(self, filepath):
+    stat = os.stat(filepath)
+    self.write({'type': 'done', 'file': os.path.abspath(filepath),
+                'mtime': stat.st_mtime_ns, 'size': stat.st_size})
+
+  def close(self):
+    with self.lock:
+      self.file.close()
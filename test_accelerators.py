@@ -0,0 +1,47 @@
+import json
+import random
+import polib
+import locale_packs
+from collections import Counter
+from accelerators import AcceleratorWeights, assign_ampersand_randomly, count_unescaped_ampersands
+from accelerator_model import model_weights
+from fuzzy_repair_tool import process_po_file
+
+PO_HEADER = '''msgid ""
+msgstr ""
+"Content-Type: text/plain; charset=UTF-8\\n"
+"Language: el\\n"
+
+'''
+
+def test_model_weights_floor_unused_positions():
+  totals = {'letters': Counter({'α': 5}), 'chosen': [5, 0, 0], 'available': [10, 10, 10]}
+  positions = model_weights(totals, locale_packs.load_pack('el'))['positions']
+  assert positions[0] == 1
+  assert all(weight > 0 for weight in positions)
+
+def test_assign_with_zero_weights(monkeypatch):
+  # Only ρ and α can take the accelerator, both at positions of weight 0
+  monkeypatch.setattr(locale_packs, 'model_weights', {'el': AcceleratorWeights({}, positions=[1, 0, 0])})
+  msgstr = assign_ampersand_randomly('Άρα', 1, locale_packs.load_pack('el'), rng=random.Random(1))
+  assert count_unescaped_ampersands(msgstr) == 1
+  assert msgstr.replace('&', '') == 'Άρα'
+
+def test_repair_with_zero_rate_position(tmp_path, monkeypatch):
+  monkeypatch.setattr(locale_packs, 'model_weights', {})
+  model_path = tmp_path / 'model.json'
+  model_path.write_text(json.dumps({'language': 'el', 'letters': {}, 'default': 100, 'positions': [1, 0, 0]}),
+                        encoding='utf-8')
+  locale_packs.use_model(model_path)
+  po_path = tmp_path / 'test.po'
+  po_path.write_text(PO_HEADER + '''#, fuzzy
+#| msgid "So"
+msgid "&So"
+msgstr "Άρα"
+''', encoding='utf-8')
+
+  count, fuzzy_count, _ = process_po_file(str(po_path), seed=1)
+  assert (count, fuzzy_count) == (1, 0)
+  entry = polib.pofile(str(po_path)).find('&So')
+  assert count_unescaped_ampersands(entry.msgstr) == 1
+  assert entry.msgstr.replace('&', '') == 'Άρα'
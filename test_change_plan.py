@@ -0,0 +1,46 @@
+import polib
+from change_plan import change_record, entry_index, apply_record
+
+PO = '''msgid ""
+msgstr ""
+"Content-Type: text/plain; charset=UTF-8\\n"
+
+msgctxt "@action:button"
+msgid "Save"
+msgstr "Αποθήκευση"
+
+#, fuzzy
+#| msgid "Save..."
+msgctxt "@action:button"
+msgid "Save"
+msgstr "Αποθήκευση..."
+'''
+
+def fuzzy_record(po):
+  """The record of the repair of the fuzzy duplicate of PO, made as a dry run would."""
+  entry = po.fuzzy_entries()[0]
+  old_msgstr = entry.msgstr
+  entry.msgstr = 'Αποθήκευση'
+  return change_record('fuzzy_repair_tool', ['trailing'], 'test.po', entry, old_msgstr, {},
+                       mark_translated=True)
+
+def test_apply_to_duplicate_key():
+  record = fuzzy_record(polib.pofile(PO))
+  po = polib.pofile(PO)
+  entry = apply_record(entry_index(po), record)
+  assert entry is po[1]
+  assert entry.msgstr == 'Αποθήκευση' and not entry.fuzzy
+  assert po[0].msgstr == 'Αποθήκευση'
+
+def test_apply_to_moved_duplicate_key():
+  record = fuzzy_record(polib.pofile(PO))
+  # Lines added above the entries since the dry run
+  po = polib.pofile(PO.replace('\n\nmsgctxt', '\n\nmsgid "Open"\nmsgstr "Άνοιγμα"\n\nmsgctxt', 1))
+  entry = apply_record(entry_index(po), record)
+  assert entry is po[2]
+  assert entry.msgstr == 'Αποθήκευση' and not entry.fuzzy
+
+def test_apply_stale():
+  record = fuzzy_record(polib.pofile(PO))
+  po = polib.pofile(PO.replace('"Αποθήκευση..."', '"Αποθήκευση…"'))
+  assert apply_record(entry_index(po), record) is None
@@ -0,0 +1,35 @@
+from po_prefilter import has_fuzzy_entries, has_excluded_accelerators
+
+PO_HEADER = '''msgid ""
+msgstr ""
+"Content-Type: text/plain; charset=UTF-8\\n"
+"Language: el\\n"
+
+'''
+
+def write_po(tmp_path, entries, newline='\n'):
+  path = tmp_path / 'test.po'
+  path.write_bytes((PO_HEADER + entries).replace('\n', newline).encode('utf-8'))
+  return str(path)
+
+def test_excluded_accelerator(tmp_path):
+  assert has_excluded_accelerators(write_po(tmp_path, 'msgid "&Open"\nmsgstr "&Άνοιγμα"\n'))
+  assert not has_excluded_accelerators(write_po(tmp_path, 'msgid "&Open"\nmsgstr "Άν&οιγμα"\n'))
+
+def test_wrapped_excluded_accelerator(tmp_path):
+  entries = '''msgid "Open the file from the working directory"
+msgstr ""
+"Άνοιγμα του αρχείου από τον κατάλογο εργασίας, μαζί με κάθε &"
+"άλλο αρχείο"
+'''
+  assert has_excluded_accelerators(write_po(tmp_path, entries))
+  assert has_excluded_accelerators(write_po(tmp_path, entries, '\r\n'))
+  assert not has_excluded_accelerators(write_po(tmp_path, entries.replace('&"\n"άλλο', '&"\n"λλο')))
+
+def test_excluded_accelerator_outside_msgstr(tmp_path):
+  assert not has_excluded_accelerators(write_po(tmp_path, 'msgid "&Άνοιγμα"\nmsgstr "Άν&οιγμα"\n'))
+  assert not has_excluded_accelerators(write_po(tmp_path, 'msgid "&&Άνοιγμα"\nmsgstr "&&Άνοιγμα"\n'))
+
+def test_fuzzy_entries(tmp_path):
+  assert has_fuzzy_entries(write_po(tmp_path, '#, fuzzy\nmsgid "Open"\nmsgstr "Άνοιγμα"\n'))
+  assert not has_fuzzy_entries(write_po(tmp_path, '#~ #, fuzzy\n#~ msgid "Open"\n#~ msgstr "Άνοιγμα"\n'))
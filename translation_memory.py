@@ -0,0 +1,171 @@
+import os
+import math
+import pickle
+import sqlite3
+import argparse
+from array import array
+from collections import namedtuple, Counter
+from difflib import SequenceMatcher
+from create_l10n_db import database_path
+
+# Translation memory over the approved entries of the l10n database. Distinct
+# msgid/msgstr pairs are indexed by the character trigrams of their msgid, so a
+# new msgid can be matched against the whole corpus in a few milliseconds:
+# candidates are counted on the posting lists of its rarest trigrams only
+# (prefix filtering), checked by trigram overlap and ranked by SequenceMatcher.
+# The index is cached next to the database and rebuilt when the database changes.
+
+NGRAM_SIZE = 3
+
+# Trigrams found in more than 1/STOP_GRAM_RATIO of the pairs (and at least
+# STOP_GRAM_MIN of them) are too common to be worth counting
+STOP_GRAM_RATIO = 20
+STOP_GRAM_MIN = 1000
+
+# Bump when the layout of the cached index changes
+INDEX_VERSION = 1
+
+Suggestion = namedtuple('Suggestion', ['msgid', 'msgstr', 'score', 'uses'])
+
+def normalize_for_matching(s):
+  """Lowercase, drop accelerator markers and collapse whitespace."""
+  return ' '.join(s.replace('&', '').lower().split())
+
+def ngrams(s):
+  """Return the set of character trigrams of an already normalized string."""
+  padded = f" {s} "
+  return {padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)}
+
+class TranslationMemory:
+  """Trigram index over msgid/msgstr pairs, answering top-k similarity lookups."""
+
+  def __init__(self, pairs):
+    """`pairs` is an iterable of (msgid, msgstr, uses) tuples."""
+    self.msgids = []
+    self.msgstrs = []
+    self.uses = []
+    self.sizes = array('I')
+    self.exact = {}
+    self.postings = {}
+    for pair_id, (msgid, msgstr, uses) in enumerate(pairs):
+      normalized = normalize_for_matching(msgid)
+      grams = ngrams(normalized)
+      self.msgids.append(msgid)
+      self.msgstrs.append(msgstr)
+      self.uses.append(uses)
+      self.sizes.append(len(grams))
+      self.exact.setdefault(normalized, []).append(pair_id)
+      for gram in grams:
+        posting = self.postings.get(gram)
+        if posting is None:
+          posting = self.postings[gram] = array('I')
+        posting.append(pair_id)
+
+  def __len__(self):
+    return len(self.msgids)
+
+  @classmethod
+  def from_database(cls, db_path, cache_path=None):
+    """
+    Load the memory for the database, from the cached index if the database did not change.
+    """
+    if cache_path is None:
+      cache_path = f"{db_path}.tm"
+    stat = os.stat(db_path)
+    signature = (INDEX_VERSION, stat.st_mtime_ns, stat.st_size)
+    try:
+      with open(cache_path, 'rb') as f:
+        cached_signature, memory = pickle.load(f)
+      if cached_signature == signature:
+        return memory
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+      pass
+    conn = sqlite3.connect(db_path)
+    try:
+      cursor = conn.cursor()
+      cursor.execute('''
+      SELECT msgid, msgstr, count(*) FROM translations
+      WHERE approved AND NOT obsolete AND msgid != ''
+      GROUP BY msgid, msgstr
+      ''')
+      memory = cls(cursor)
+    finally:
+      conn.close()
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+      pickle.dump((signature, memory), f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+    return memory
+
+  def candidates(self, grams, min_score, max_verify=200):
+    """
+    Return [(dice, pair_id)] for pairs whose trigram Dice coefficient with `grams` is at least
+    `min_score`, best first. Two sets can only reach it if they share
+    ceil(min_score * |grams| / 2) trigrams, so every match shares one of the rarest trigrams
+    outside the `required - 1` most common ones. Pairs are counted on those rare trigrams
+    only, without stop-grams found in a large part of the corpus, and the best `max_verify`
+    are checked exactly.
+    """
+    size = len(grams)
+    known = sorted((self.postings[gram] for gram in grams if gram in self.postings), key=len)
+    required = max(1, math.ceil(min_score * size / 2))
+    prefix = known[:len(known) - required + 1]
+    if not prefix:
+      return []
+    max_posting = max(STOP_GRAM_MIN, len(self.msgids) // STOP_GRAM_RATIO)
+    counts = Counter()
+    for posting in prefix:
+      if len(posting) > max_posting and counts:
+        break
+      counts.update(posting)
+    min_size = min_score * size / (2 - min_score)
+    max_size = (2 - min_score) * size / min_score
+    sizes = self.sizes
+    matches = []
+    for pair_id, _ in counts.most_common(max_verify):
+      other_size = sizes[pair_id]
+      if not min_size <= other_size <= max_size:
+        continue
+      overlap = len(grams & ngrams(normalize_for_matching(self.msgids[pair_id])))
+      dice = 2 * overlap / (size + other_size)
+      if dice >= min_score:
+        matches.append((dice, pair_id))
+    matches.sort(reverse=True)
+    return matches
+
+  def lookup(self, msgid, k=5, min_score=0.5, max_candidates=50):
+    """
+    Return up to `k` Suggestions for translating `msgid`, best first. Exact matches score 1,
+    near matches are scored with SequenceMatcher on the original strings.
+    """
+    normalized = normalize_for_matching(msgid)
+    scored = {}
+    for pair_id in self.exact.get(normalized, ()):
+      scored[pair_id] = 1.0 if self.msgids[pair_id] == msgid else 0.99
+    grams = ngrams(normalized)
+    if len(scored) < k and grams:
+      for _, pair_id in self.candidates(grams, min_score)[:max_candidates]:
+        if pair_id not in scored:
+          score = SequenceMatcher(None, msgid, self.msgids[pair_id]).ratio()
+          if score >= min_score:
+            scored[pair_id] = score
+    ranked = sorted(scored, key=lambda pair_id: (-scored[pair_id], -self.uses[pair_id]))
+    return [Suggestion(self.msgids[pair_id], self.msgstrs[pair_id], scored[pair_id], self.uses[pair_id])
+            for pair_id in ranked[:k]]
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="Suggest translations for a msgid from the l10n database.")
+  parser.add_argument('msgid', help="The message to translate.")
+  parser.add_argument('--db', default=database_path, help="The l10n database to use.")
+  parser.add_argument('-k', type=int, default=5, help="The number of suggestions.")
+  parser.add_argument('--min-score', type=float, default=0.5, help="The minimum similarity.")
+  return parser.parse_args()
+
+def main():
+  args = parse_args()
+  memory = TranslationMemory.from_database(args.db)
+  for suggestion in memory.lookup(args.msgid, args.k, args.min_score):
+    print(f"{suggestion.score:.2f}  {suggestion.msgid}\n      ↳ {suggestion.msgstr}")
+
+if __name__ == "__main__":
+  main()